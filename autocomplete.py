@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+autocomplete.py -- Udacity conference server-side Python App Engine
+    prefix autocomplete index for conference topics, cities and speakers
+
+Every prefix (up to AUTOCOMPLETE_MAX_PREFIX characters) of a term maps to
+its own memcache shard holding the top AUTOCOMPLETE_TOP_N [term, count]
+pairs, so a lookup is a single memcache get. AutocompleteTerm entities in
+the Datastore are authoritative; a missing shard is rebuilt from them.
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import AutocompleteTerm
+
+AUTOCOMPLETE_FIELDS = {
+    'CITY': 'city',
+    'TOPIC': 'topics',
+    'SPEAKER': 'speaker',
+}
+
+AUTOCOMPLETE_MAX_PREFIX = 10
+AUTOCOMPLETE_TOP_N = 10
+AUTOCOMPLETE_CAS_RETRIES = 5
+MEMCACHE_AUTOCOMPLETE_KEY = "AUTOCOMPLETE %s %s"
+
+
+def _normalize(term):
+    """Return the case/whitespace insensitive form of term."""
+    return ' '.join((term or '').lower().split())
+
+
+def _prefixes(norm):
+    """Return the indexed prefixes of a normalized term."""
+    return [norm[:i]
+            for i in range(1, min(len(norm), AUTOCOMPLETE_MAX_PREFIX) + 1)]
+
+
+def _cacheKey(field, prefix):
+    return MEMCACHE_AUTOCOMPLETE_KEY % (field, prefix)
+
+
+def _sortEntries(entries):
+    """Order entries by count (desc) then term and keep the top N."""
+    entries.sort(key=lambda entry: (-entry[1], entry[0]))
+    return entries[:AUTOCOMPLETE_TOP_N]
+
+# - - - Writes - - - - - - - - - - - - - - - - - - - -
+
+
+@ndb.transactional()
+def _bumpTerm(field, term, delta):
+    """Adjust the stored count of term; return (term, new count)."""
+    norm = _normalize(term)
+    key = ndb.Key(AutocompleteTerm, '%s:%s' % (field, norm))
+    entity = key.get()
+    if not entity:
+        entity = AutocompleteTerm(
+            key=key, field=field, term=term.strip(), count=0,
+            prefixes=['%s:%s' % (field, p) for p in _prefixes(norm)])
+    entity.count += delta
+    if entity.count > 0:
+        entity.put()
+    else:
+        key.delete()
+    return entity.term, max(entity.count, 0)
+
+
+def _updateShard(field, prefix, term, count, decreased):
+    """Merge (term, count) into a cached prefix shard using cas.
+
+    Missing shards are left alone (they are rebuilt on the next read).
+    A full shard is dropped when one of its terms decreases, since a term
+    outside the cached top N may now belong in it.
+    """
+    client = memcache.Client()
+    key = _cacheKey(field, prefix)
+    norm = _normalize(term)
+    for _ in range(AUTOCOMPLETE_CAS_RETRIES):
+        entries = client.gets(key)
+        if entries is None:
+            return
+        present = any(_normalize(t) == norm for t, _ in entries)
+        if decreased and present and len(entries) >= AUTOCOMPLETE_TOP_N:
+            break
+        entries = [[t, c] for t, c in entries if _normalize(t) != norm]
+        if count > 0:
+            entries.append([term, count])
+        if client.cas(key, _sortEntries(entries)):
+            return
+    client.delete(key)
+
+
+def recordTerms(field, added=(), removed=()):
+    """Incrementally update the index for terms added to/removed from
+    entities of the given field ('city', 'topics' or 'speaker')."""
+    for terms, delta in ((added, 1), (removed, -1)):
+        for term in terms:
+            if not _normalize(term):
+                continue
+            term, count = _bumpTerm(field, term, delta)
+            for prefix in _prefixes(_normalize(term)):
+                _updateShard(field, prefix, term, count, delta < 0)
+
+
+def countedTerm(field, term, count):
+    """Return the AutocompleteTerm of term with its count set to count
+    (0 hides it), or None if it is already stored with that count."""
+    norm = _normalize(term)
+    key = ndb.Key(AutocompleteTerm, '%s:%s' % (field, norm))
+    entity = key.get()
+    if entity is None:
+        if count <= 0:
+            return None
+        entity = AutocompleteTerm(
+            key=key, field=field, term=term.strip(), count=0,
+            prefixes=['%s:%s' % (field, p) for p in _prefixes(norm)])
+    if entity.count == count:
+        return None
+    entity.count = count
+    return entity
+
+
+def dropShards(terms):
+    """Drop the cached prefix shards of the given AutocompleteTerms, so
+    they are rebuilt from the Datastore."""
+    memcache.delete_multi([_cacheKey(*prefix.split(':', 1))
+                           for term in terms for prefix in term.prefixes])
+
+# - - - Reads - - - - - - - - - - - - - - - - - - - -
+
+
+def _buildShard(field, prefix):
+    """Rebuild a prefix shard from the Datastore."""
+    terms = AutocompleteTerm.query(
+        AutocompleteTerm.prefixes == '%s:%s' % (field, prefix),
+        AutocompleteTerm.count > 0
+    ).order(-AutocompleteTerm.count).fetch(AUTOCOMPLETE_TOP_N)
+    return _sortEntries([[t.term, t.count] for t in terms])
+
+
+def lookup(field, prefix):
+    """Return up to AUTOCOMPLETE_TOP_N terms of field starting with prefix."""
+    norm = _normalize(prefix)
+    if not norm:
+        return []
+    shard = norm[:AUTOCOMPLETE_MAX_PREFIX]
+    key = _cacheKey(field, shard)
+
+    entries = memcache.get(key)
+    if entries is None:
+        entries = _buildShard(field, shard)
+        memcache.add(key, entries)
+
+    return [term for term, _ in entries
+            if _normalize(term).startswith(norm)]
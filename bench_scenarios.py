@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+bench_scenarios.py -- Udacity conference server-side Python App Engine
+    run endpoint scenarios against the in-memory repository
+
+Calls ConferenceApi methods directly, with repository.MemoryRepository
+as storage and only the in-process memcache stub registered (for the
+per-instance conference cache), so any Datastore or task queue RPC fails
+loudly instead of being slowed down by a stub:
+
+    python bench_scenarios.py --sdk ~/google-cloud-sdk/platform/google_appengine
+
+In each scenario an organizer creates conferences with sessions,
+attendees register, query conferences & list sessions, wishlist sessions,
+page through their agendas & hold a seat at checkout, the organizer
+moves a conference to another city (fanning out notifications) and joins
+its waitlist, and the attendees unregister (promoting the organizer).
+Prints scenarios & endpoint calls per second and the side effects
+recorded in the repository's outbox.
+"""
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+CITIES = ('London', 'Paris', 'Berlin', 'Tokyo')
+TOPICS = ('Medical Innovations', 'Web Technologies', 'Programming')
+SPEAKERS = ('Ada', 'Grace', 'Linus')
+
+
+def _setup(sdk):
+    """Put the SDK on sys.path & register the memcache stub only."""
+    if sdk:
+        sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_memcache_stub()
+    return bed
+
+
+class Client(object):
+    """Calls ConferenceApi endpoints as a given user, counting calls."""
+
+    def __init__(self, api):
+        import endpoints
+        from google.appengine.api import users
+        self._api = api
+        self._users = users
+        self._current = None
+        self.calls = 0
+        endpoints.get_current_user = lambda: self._current
+
+    def actAs(self, email):
+        self._current = self._users.User(email=email)
+
+    def call(self, method, request):
+        self.calls += 1
+        return getattr(self._api, method)(request)
+
+
+def runScenario(client, i, conferences, attendees):
+    """Run one scenario; users are unique to scenario number i."""
+    import conference
+    from protorpc.message_types import VoidMessage
+    from models import ConferenceForm
+    from models import ConferenceQueryForm
+    from models import ConferenceQueryForms
+    from models import ProfileMiniForm
+
+    def request(container, **fields):
+        return container.combined_message_class(**fields)
+
+    client.actAs('organizer%d@example.com' % i)
+    client.call('saveProfile', ProfileMiniForm(displayName='Org %d' % i))
+    for c in xrange(conferences):
+        client.call('createConference', ConferenceForm(
+            name='Conference %d-%d' % (i, c),
+            city=CITIES[c % len(CITIES)],
+            topics=[TOPICS[c % len(TOPICS)]],
+            startDate='2026-%02d-10' % (c % 12 + 1),
+            endDate='2026-%02d-12' % (c % 12 + 1),
+            maxAttendees=attendees))
+    wscks = [cf.websafeKey for cf in client.call(
+        'getConferencesCreated', request(conference.CONF_LIST_REQUEST)
+    ).items]
+    for c, wsck in enumerate(wscks):
+        for s, speaker in enumerate(SPEAKERS):
+            client.call('createSession', request(
+                conference.SESS_POST_REQUEST, websafeConferenceKey=wsck,
+                name='Session %d' % s, speaker=speaker,
+                typeOfSession=['Talk'], date='2026-%02d-10' % (c % 12 + 1),
+                startTime='%02d:00' % (9 + s), duration='60'))
+
+    emails = ['attendee%d-%d@example.com' % (i, a)
+              for a in xrange(attendees)]
+    for email in emails:
+        client.actAs(email)
+        for wsck in wscks[:3]:
+            client.call('registerForConference', request(
+                conference.CONF_GET_REQUEST, websafeConferenceKey=wsck))
+            client.call('getConference', request(
+                conference.CONF_GET_REQUEST, websafeConferenceKey=wsck))
+            sessions = client.call('getConferenceSessions', request(
+                conference.SESS_GET_REQUEST, websafeConferenceKey=wsck))
+        client.call('queryConferences', ConferenceQueryForms(filters=[
+            ConferenceQueryForm(field='CITY', operator='EQ',
+                                value='London'),
+            ConferenceQueryForm(field='MONTH', operator='GT', value='3')]))
+        client.call('getSessionsBySpeaker', request(
+            conference.SESS_GET_BY_SPEAKER_REQUEST, speaker='Ada'))
+
+        wssks = [sf.websafeSessionKey for sf in sessions.items]
+        for wssk in wssks:
+            client.call('addSessionToWishlist', request(
+                conference.WL_ADD_REQUEST, sessionKey=wssk,
+                checkConflicts=True))
+        client.call('getWishlistConflicts', VoidMessage())
+        client.call('deleteSessionInWishlist', request(
+            conference.WL_POST_REQUEST, sessionKey=wssks[0]))
+        client.call('getPopularSessions', request(
+            conference.POPULAR_GET_REQUEST,
+            websafeConferenceKey=wscks[min(2, len(wscks) - 1)]))
+
+        token = None
+        while True:
+            agenda = client.call('getMyAgenda', request(
+                conference.AGENDA_GET_REQUEST, limit=4, pageToken=token))
+            token = agenda.nextPageToken
+            if not token:
+                break
+
+        if len(wscks) > 3:
+            hold = client.call('holdSeat', request(
+                conference.CONF_GET_REQUEST, websafeConferenceKey=wscks[3]))
+            client.call('releaseSeatHold', request(
+                conference.HOLD_POST_REQUEST,
+                websafeHoldKey=hold.websafeHoldKey))
+
+    client.actAs('organizer%d@example.com' % i)
+    client.call('updateConference', request(
+        conference.CONF_POST_REQUEST, websafeConferenceKey=wscks[0],
+        city='Lisbon'))
+    # sold out once every attendee registered
+    client.call('joinWaitlist', request(
+        conference.CONF_GET_REQUEST, websafeConferenceKey=wscks[0]))
+
+    for email in emails:
+        client.actAs(email)
+        client.call('unregisterFromConference', request(
+            conference.CONF_GET_REQUEST, websafeConferenceKey=wscks[0]))
+    # what the promote_waitlist tasks enqueued above do
+    conference.ConferenceApi._promoteWaitlist(wscks[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sdk', help='App Engine SDK directory '
+                        '(the one containing dev_appserver.py)')
+    parser.add_argument('--scenarios', type=int, default=200,
+                        help='scenarios to run (default 200)')
+    parser.add_argument('--conferences', type=int, default=5,
+                        help='conferences per scenario (default 5)')
+    parser.add_argument('--attendees', type=int, default=5,
+                        help='attendees per scenario (default 5)')
+    args = parser.parse_args()
+
+    bed = _setup(args.sdk)
+    try:
+        from conference import ConferenceApi
+        from repository import MemoryRepository
+
+        repository = ConferenceApi.repository = MemoryRepository()
+        client = Client(ConferenceApi())
+
+        started = time.time()
+        for i in xrange(args.scenarios):
+            runScenario(client, i, max(args.conferences, 1),
+                        args.attendees)
+        elapsed = time.time() - started
+    finally:
+        bed.deactivate()
+
+    print '%d scenarios, %d endpoint calls in %.2fs' % (
+        args.scenarios, client.calls, elapsed)
+    print '%.1f scenarios/s, %.1f calls/s' % (
+        args.scenarios / elapsed, client.calls / elapsed)
+    effects = collections.Counter(effect[0] for effect in repository.outbox)
+    print 'outbox: %s' % ', '.join(
+        '%d %s' % (n, kind) for kind, n in sorted(effects.items()))
+
+
+if __name__ == '__main__':
+    main()
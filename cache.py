@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+cache.py -- Udacity conference server-side Python App Engine
+    memcache helper with stampede protection for computed values
+
+Values are stored with a soft expiry. Past it, the first request to take
+the lease (a memcache.add lock) enqueues a background refresh while
+everybody keeps getting the stale value. On a hard miss (eviction, flush,
+new deploy) the lease holder rebuilds synchronously and the other
+requests wait briefly for it instead of all hitting the Datastore.
+Hits, stale hits, misses and rebuilds are counted in memcache.
+
+Entries live under their own memcache keys (MEMCACHE_ENTRY_KEY), not the
+plain value keys earlier versions of the app stored strings under, and
+anything that is not a (value, soft expiry) pair counts as a miss.
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+from tasks import addTask
+from tasks import taskName
+
+CACHE_LEASE_SECONDS = 10
+CACHE_WAIT_SECONDS = 0.05
+CACHE_WAIT_TRIES = 10
+CACHE_REFRESH_URL = '/tasks/refresh_cache'
+MEMCACHE_ENTRY_KEY = "CACHED %s"
+MEMCACHE_LEASE_KEY = "LEASE %s"
+MEMCACHE_STATS_KEY = "CACHE STATS %s %s"
+CACHE_STATS = ('hit', 'stale', 'miss', 'rebuild')
+
+# memcache key -> (function computing the value, soft ttl in seconds)
+CACHED_VALUES = {}
+
+
+def registerCachedValue(key, compute, softTtl):
+    """Declare how the value cached under key is (re)computed."""
+    CACHED_VALUES[key] = (compute, softTtl)
+
+
+def _count(key, stat):
+    memcache.incr(MEMCACHE_STATS_KEY % (key, stat), initial_value=0)
+
+
+def _getEntry(key):
+    """Return the cached (value, soft expiry) for key, or None."""
+    entry = memcache.get(MEMCACHE_ENTRY_KEY % key)
+    if isinstance(entry, tuple) and len(entry) == 2:
+        return entry
+    return None
+
+
+def _takeLease(key):
+    return memcache.add(MEMCACHE_LEASE_KEY % key, 1,
+                        time=CACHE_LEASE_SECONDS)
+
+
+def refreshCachedValue(key):
+    """Recompute & store the value for key, releasing its lease."""
+    compute, soft_ttl = CACHED_VALUES[key]
+    value = compute()
+    memcache.set(MEMCACHE_ENTRY_KEY % key, (value, time.time() + soft_ttl))
+    memcache.delete(MEMCACHE_LEASE_KEY % key)
+    _count(key, 'rebuild')
+    return value
+
+
+def getCachedValue(key):
+    """Return the cached value for key, rebuilding it at most once
+    across concurrent requests."""
+    entry = _getEntry(key)
+    if entry is not None:
+        value, soft_expiry = entry
+        if soft_expiry > time.time():
+            _count(key, 'hit')
+        else:
+            _count(key, 'stale')
+            if _takeLease(key):
+                # one refresh per key & soft expiry, however many leases
+                addTask(params={'key': key}, url=CACHE_REFRESH_URL,
+                        name=taskName('refresh', key, int(soft_expiry)))
+        return value
+
+    _count(key, 'miss')
+    if _takeLease(key):
+        return refreshCachedValue(key)
+
+    # somebody else is rebuilding; give them a moment
+    for _ in range(CACHE_WAIT_TRIES):
+        time.sleep(CACHE_WAIT_SECONDS)
+        entry = _getEntry(key)
+        if entry is not None:
+            return entry[0]
+
+    # the lease holder is stuck; compute without storing
+    return CACHED_VALUES[key][0]()
+
+
+def getCacheStats(key):
+    """Return {stat: count} for key."""
+    counts = memcache.get_multi([MEMCACHE_STATS_KEY % (key, stat)
+                                 for stat in CACHE_STATS])
+    return {stat: counts.get(MEMCACHE_STATS_KEY % (key, stat), 0)
+            for stat in CACHE_STATS}
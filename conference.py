@@ -5,6 +5,9 @@ conference.py -- Udacity conference server-side Python App Engine API;
     uses Google Cloud Endpoints
 """
 
+import base64
+import heapq
+import json
 import time
 import datetime
 
@@ -14,12 +17,33 @@ from protorpc import message_types
 from protorpc import remote
 
 from google.appengine.ext import ndb
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
+from google.appengine.api import datastore_errors
+from google.appengine.api import search
 
 from utils import getUserId
 
+from cache import getCachedValue
+from cache import refreshCachedValue
+from cache import registerCachedValue
+from hotcache import HotCache
+from fanout import MATERIAL_FIELDS
+from fanout import describeChanges
+from repository import NdbRepository
+from popularity import LEADERBOARD_ALL
+from profiler import profileService
+from schedule import findOverlaps
+from schedule import sessionInterval
+from tasks import taskName
+
+from autocomplete import AUTOCOMPLETE_FIELDS
+from autocomplete import lookup as autocompleteLookup
+
+from textsearch import CONFERENCE_INDEX
+from textsearch import SESSION_INDEX
+from textsearch import searchKeys
+
 from models import StringMessage
+from models import FeaturedSpeaker
 from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
@@ -28,6 +52,8 @@ from models import TeeShirtSize
 from models import Conference
 from models import ConferenceForm
 from models import ConferenceForms
+from models import ConferenceSummaryForm
+from models import View
 
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
@@ -35,6 +61,23 @@ from models import ConferenceQueryForms
 from models import Session
 from models import SessionForm
 from models import SessionForms
+from models import SessionSummaryForm
+from models import SessionConflictForm
+from models import SessionConflictForms
+from models import SessionPopularityForm
+from models import SessionPopularityForms
+from models import SessionRecommendations
+from models import SessionRecommendationForm
+from models import SessionRecommendationForms
+
+from models import AutocompleteForm
+
+from models import SeatHold
+from models import SeatHoldForm
+from models import SeatAvailabilityForm
+
+from models import WaitlistEntry
+from models import WaitlistForm
 
 from models import BooleanMessage
 from models import ConflictException
@@ -45,6 +88,8 @@ EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT ANNOUNCEMENTS"
 MEMCACHE_SPEAKER_KEY = "RECENT SPEAKER"
+ANNOUNCEMENT_SOFT_TTL = 60 * 60
+SPEAKER_SOFT_TTL = 60 * 60
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
@@ -55,6 +100,12 @@ DEFAULTS_CONFERENCE = {
     "topics": ["Default", "Topic"]
 }
 
+# placeholders filled in for missing fields, not worth suggesting
+AUTOCOMPLETE_PLACEHOLDERS = {
+    'city': [DEFAULTS_CONFERENCE['city']],
+    'topics': DEFAULTS_CONFERENCE['topics'],
+}
+
 DEFAULTS_SESSSION = {
     "name": "Default",
     "highlights": "",
@@ -79,13 +130,47 @@ FIELDS = {
         'TOPIC': 'topics',
         'MONTH': 'month',
         'MAX_ATTENDEES': 'maxAttendees',
+        'START_DATE': 'startDate',
+        'END_DATE': 'endDate',
         }
 
+CONF_SUMMARY_FIELDS = ['name', 'city', 'startDate', 'endDate']
+SESS_SUMMARY_FIELDS = ['name', 'speaker', 'date', 'startTime']
+
+MAX_BATCH_KEYS = 100
+
+# per-instance cache of (Conference, organizer displayName) by websafe key
+CONFERENCE_CACHE = HotCache(maxSize=1000, ttl=5)
+# conferences starting soonest, loaded into it by warmup requests
+WARMUP_CONFERENCES = 50
+
+WAITLIST_PROMOTE_BATCH = 10
+
+AGENDA_DEFAULT_LIMIT = 20
+AGENDA_MAX_LIMIT = 100
+
+SEAT_HOLD_SECONDS = 10 * 60
+SEAT_HOLD_SWEEP_BATCH = 500
+
+UPCOMING_DEFAULT_DAYS = 30
+UPCOMING_DEFAULT_LIMIT = 20
+UPCOMING_MAX_LIMIT = 100
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
 )
 
+CONF_LIST_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    view=messages.EnumField(View, 1, default='FULL'),
+)
+
+BATCH_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeKeys=messages.StringField(1, repeated=True),
+)
+
 CONF_POST_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1),
@@ -94,6 +179,7 @@ CONF_POST_REQUEST = endpoints.ResourceContainer(
 SESS_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
+    view=messages.EnumField(View, 2, default='FULL'),
 )
 
 SESS_POST_REQUEST = endpoints.ResourceContainer(
@@ -109,7 +195,49 @@ SESS_GET_BY_TYPE_REQUEST = endpoints.ResourceContainer(
 
 SESS_GET_BY_SPEAKER_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    speaker=messages.StringField(1)
+    speaker=messages.StringField(1),
+    view=messages.EnumField(View, 2, default='FULL'),
+)
+
+UPCOMING_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    days=messages.IntegerField(1),
+    limit=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+)
+
+AUTOCOMPLETE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    field=messages.StringField(1),
+    prefix=messages.StringField(2),
+)
+
+SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1),
+    limit=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+)
+
+AGENDA_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    limit=messages.IntegerField(1),
+    pageToken=messages.StringField(2),
+)
+
+POPULAR_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+)
+
+RECOMMEND_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    sessionKey=messages.StringField(1),
+)
+
+HOLD_POST_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeHoldKey=messages.StringField(1),
 )
 
 WL_POST_REQUEST = endpoints.ResourceContainer(
@@ -117,6 +245,12 @@ WL_POST_REQUEST = endpoints.ResourceContainer(
     sessionKey=messages.StringField(1),
 )
 
+WL_ADD_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    sessionKey=messages.StringField(1),
+    checkConflicts=messages.BooleanField(2),
+)
+
 
 @endpoints.api(name='conference',
                version='v1',
@@ -125,66 +259,110 @@ WL_POST_REQUEST = endpoints.ResourceContainer(
 class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
-# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+    # Profile/Conference/Session storage; tests & benchmarks may swap in
+    # a repository.MemoryRepository
+    repository = NdbRepository()
+
+# - - - Batch helpers - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
+    def _getMultiByWebsafeKeys(websafeKeys, kind):
+        """Resolve websafe keys of the given kind with one get_multi.
+
+        Returns (entities, missing) where entities keeps request order and
+        missing lists the websafe keys that are malformed, of another kind
+        or not found.
         """
+        if len(websafeKeys) > MAX_BATCH_KEYS:
+            raise endpoints.BadRequestException(
+                "At most %d keys may be requested at once." % MAX_BATCH_KEYS)
 
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
+        keys, wanted, missing = [], [], []
+        for wsk in websafeKeys:
+            try:
+                key = ndb.Key(urlsafe=wsk)
+            except Exception:
+                key = None
+            if key is None or key.kind() != kind.__name__:
+                missing.append(wsk)
+            else:
+                keys.append(key)
+                wanted.append(wsk)
+
+        entities = []
+        for wsk, entity in zip(wanted,
+                               ConferenceApi.repository.getMulti(keys)):
+            if entity is None:
+                missing.append(wsk)
+            else:
+                entities.append(entity)
+        return entities, missing
 
-        if confs:
-            print "We are going to set the announcement"
+    @staticmethod
+    def _getDisplayNames(confs):
+        """Return {organizerUserId: displayName} with one get_multi."""
+        user_ids = list(set(conf.organizerUserId for conf in confs))
+        profiles = ConferenceApi.repository.getMulti(
+            [ndb.Key(Profile, user_id) for user_id in user_ids])
+        return {user_id: getattr(prof, 'displayName', None)
+                for user_id, prof in zip(user_ids, profiles)}
 
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences '
-                'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
-            print "The announcement has been set."
-        else:
-            print "We are going to delete the announcement from memcache"
+    @staticmethod
+    def _computeAnnouncement():
+        """Return Announcement of nearly sold out conferences
+        (empty string if there are none)."""
+
+        confs = ConferenceApi.repository.conferencesNearlySoldOut(
+            5, projection=['name'])
 
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+        if not confs:
+            return ""
 
-            print "The announcement has been deleted from memcache"
+        return '%s %s' % (
+            'Last chance to attend! The following conferences '
+            'are nearly sold out:',
+            ', '.join(conf.name for conf in confs))
+
+    @staticmethod
+    def _cacheAnnouncement():
+        """Create Announcement & assign to memcache; used by
+        memcache cron job & putAnnouncement().
+        """
+        return refreshCachedValue(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    @staticmethod
+    def _computeFeaturedSpeaker():
+        """Return Featured speaker message from the Datastore."""
+        featured = ndb.Key(FeaturedSpeaker, 'current').get()
+        if not featured or not featured.speaker:
+            return ""
+        return "Featured speaker: %s" % featured.speaker
 
-        return announcement
+    @staticmethod
+    def _cacheFeaturedSpeaker(speaker):
+        """Store speaker as Featured speaker & assign to memcache;
+        used by the set_featured_speaker task."""
+        FeaturedSpeaker(id='current', speaker=speaker).put()
+        return refreshCachedValue(MEMCACHE_SPEAKER_KEY)
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
 
-        # return an existing announcement from Memcache or an empty string.
-        announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
-        if not announcement:
-            announcement = ""
-        return StringMessage(data=announcement)
+        # rebuilt (once) from the Datastore if evicted
+        return StringMessage(
+            data=getCachedValue(MEMCACHE_ANNOUNCEMENTS_KEY))
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
         """Return Speaker from memcache."""
 
-        # return an existing announcement from Memcache or an empty string.
-        speaker = memcache.get(MEMCACHE_SPEAKER_KEY)
-
-        if not speaker:
-            speaker = ""
-
-        return StringMessage(data=speaker)
+        # rebuilt (once) from the Datastore if evicted
+        return StringMessage(data=getCachedValue(MEMCACHE_SPEAKER_KEY))
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
     def _copyProfileToForm(self, prof):
@@ -213,7 +391,7 @@ class ConferenceApi(remote.Service):
         # get Profile from datastore
         user_id = getUserId(user)
         p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
+        profile = self.repository.get(p_key)
         # create new Profile if not there
         if not profile:
             profile = Profile(
@@ -222,7 +400,7 @@ class ConferenceApi(remote.Service):
                 mainEmail=user.email(),
                 teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
             )
-            profile.put()
+            self.repository.put(profile)
 
         return profile
 
@@ -238,7 +416,7 @@ class ConferenceApi(remote.Service):
                     val = getattr(save_request, field)
                     if val:
                         setattr(prof, field, str(val))
-            prof.put()
+            self.repository.put(prof)
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -273,6 +451,31 @@ class ConferenceApi(remote.Service):
         cf.check_initialized()
         return cf
 
+    def _copyConferenceToSummaryForm(self, conf, fixed=None):
+        """Copy summary fields from (projected) Conference to
+        ConferenceSummaryForm; fixed holds values known from filters."""
+        csf = ConferenceSummaryForm(websafeKey=conf.key.urlsafe())
+        for field in CONF_SUMMARY_FIELDS:
+            if fixed and field in fixed:
+                value = fixed[field]
+            else:
+                value = getattr(conf, field)
+            # convert Date to date string; just copy others
+            if field.endswith('Date') and value is not None:
+                value = str(value)
+            setattr(csf, field, value)
+        csf.check_initialized()
+        return csf
+
+    @staticmethod
+    def _projection(fields, fixed=None):
+        """Return the fields a projection query can fetch.
+
+        Fields pinned by an equality filter cannot be projected, so they
+        are left out (and filled in from fixed by the caller).
+        """
+        return [f for f in fields if not (fixed and f in fixed)]
+
     def _createConferenceObject(self, request):
         """Create or update Conference object
         returning ConferenceForm/request."""
@@ -317,24 +520,35 @@ class ConferenceApi(remote.Service):
         # generate Profile Key based on user ID and Conference
         # ID based on Profile key get Conference key from ID
         p_key = ndb.Key(Profile, user_id)
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
-        c_key = ndb.Key(Conference, c_id, parent=p_key)
+        c_key = self.repository.allocateKey(Conference, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
-        # create Conference, send email to organizer confirming
-        Conference(**data).put()
-        taskqueue.add(
-            params={
-                'email': user.email(),
-                'conferenceInfo': repr(request)},
-            url='/tasks/send_confirmation_email'
-        )
-
+        # create Conference, queue email to organizer confirming & index
+        # it; the tasks are transactional, so they are enqueued if and
+        # only if the Conference is stored
+        def create():
+            self.repository.put(Conference(**data))
+            self.repository.queueConfirmationEmail(user.email(), {
+                'name': data['name'],
+                'city': data['city'],
+                'startDate': request.startDate,
+                'endDate': request.endDate,
+                'websafeKey': c_key.urlsafe()}, transactional=True)
+            self._queueAutocompleteUpdate('city', added=[data['city']],
+                                          transactional=True)
+            self._queueAutocompleteUpdate('topics', added=data['topics'],
+                                          transactional=True)
+            self._queueSearchIndex(c_key.urlsafe(), transactional=True)
+
+        self.repository.transaction(create)
         return request
 
-    @ndb.transactional()
     def _updateConferenceObject(self, request):
+        return self.repository.transaction(
+            lambda: self._updateConferenceTxn(request))
+
+    def _updateConferenceTxn(self, request):
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
@@ -346,7 +560,8 @@ class ConferenceApi(remote.Service):
 
         # update existing conference
         # get conference key
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = self.repository.get(
+            ndb.Key(urlsafe=request.websafeConferenceKey))
 
         # check that conference exists
         if not conf:
@@ -359,6 +574,9 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        old_terms = {'city': [conf.city], 'topics': list(conf.topics)}
+        old_values = {f: getattr(conf, f) for f in MATERIAL_FIELDS}
+
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
@@ -367,36 +585,49 @@ class ConferenceApi(remote.Service):
             if data not in (None, []):
                 # special handling for dates (convert string to Date)
                 if field.name in ('startDate', 'endDate'):
-                    data = datetime.strptime(data, "%Y-%m-%d").date()
+                    data = datetime.datetime.strptime(
+                                    data[:10], "%Y-%m-%d").date()
                     if field.name == 'startDate':
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
-        conf.put()
-        prof = ndb.Key(Profile, user_id).get()
+        self.repository.put(conf)
+
+        # refresh autocomplete for changed cities/topics once committed
+        new_terms = {'city': [conf.city], 'topics': list(conf.topics)}
+        for field in new_terms:
+            self._queueAutocompleteUpdate(
+                field,
+                added=set(new_terms[field]) - set(old_terms[field]),
+                removed=set(old_terms[field]) - set(new_terms[field]),
+                transactional=True)
+        self._queueSearchIndex(conf.key.urlsafe(), transactional=True)
+
+        # tell attendees about date/city changes, in the background
+        changes = describeChanges(
+            old_values, {f: getattr(conf, f) for f in MATERIAL_FIELDS})
+        if changes:
+            self.repository.startFanout(conf, changes)
+
+        prof = self.repository.get(ndb.Key(Profile, user_id))
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
-    def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
+    def _parseFilters(self, request):
+        """Return (inequality field, filters) of the submitted filters,
+        with their values converted to the property types."""
         inequality_filter, filters = self._formatFilters(request.filters)
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
-
         for filtr in filters:
             if filtr["field"] in ["month", "maxAttendees"]:
                 filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(
-                                filtr["field"],
-                                filtr["operator"],
-                                filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+            elif filtr["field"] in ["startDate", "endDate"]:
+                try:
+                    filtr["value"] = datetime.datetime.strptime(
+                                    filtr["value"][:10], "%Y-%m-%d").date()
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                            "Date filters must be in YYYY-MM-DD format.")
+        return inequality_filter, filters
 
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
@@ -436,26 +667,73 @@ class ConferenceApi(remote.Service):
                       http_method='PUT', name='updateConference')
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
-        return self._updateConferenceObject(request)
+        cf = self._updateConferenceObject(request)
+        CONFERENCE_CACHE.invalidate(request.websafeConferenceKey)
+        return cf
+
+    @staticmethod
+    def _loadConference(websafeConferenceKey):
+        """Return (Conference, organizer displayName) for a websafe key."""
+        try:
+            conf = ConferenceApi.repository.get(
+                ndb.Key(urlsafe=websafeConferenceKey))
+        except Exception:
+            conf = None
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % websafeConferenceKey)
+
+        prof = ConferenceApi.repository.get(conf.key.parent())
+        return conf, getattr(prof, 'displayName', None)
+
+    @staticmethod
+    def _primeCaches():
+        """Fill the announcement, featured speaker & this instance's
+        conference cache before it serves traffic; used by the warmup
+        handler. Returns the number of conferences cached."""
+        getCachedValue(MEMCACHE_ANNOUNCEMENTS_KEY)
+        getCachedValue(MEMCACHE_SPEAKER_KEY)
+
+        confs, _ = ConferenceApi.repository.conferencesStartingBetween(
+            datetime.datetime.now().date(), None, WARMUP_CONFERENCES)
+        names = ConferenceApi._getDisplayNames(confs)
+        for conf in confs:
+            entry = (conf, names[conf.organizerUserId])
+            CONFERENCE_CACHE.get(conf.key.urlsafe(),
+                                 lambda entry=entry: entry)
+        return len(confs)
 
     @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        try:
-            conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        except:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' %
-                request.websafeConferenceKey)
+        # get Conference object from instance cache or request; bail if
+        # not found. Concurrent lookups of one key share a single fetch.
+        wsck = request.websafeConferenceKey
+        conf, displayName = CONFERENCE_CACHE.get(
+            wsck, lambda: self._loadConference(wsck))
 
-        prof = conf.key.parent().get()
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        return self._copyConferenceToForm(conf, displayName)
+
+    @endpoints.method(BATCH_GET_REQUEST, ConferenceForms,
+                      path='conferences/batch',
+                      http_method='GET', name='getConferences')
+    def getConferences(self, request):
+        """Return the requested conferences (by websafeKeys) in one call;
+        keys that could not be resolved are listed in missingKeys."""
+        confs, missing = self._getMultiByWebsafeKeys(request.websafeKeys,
+                                                     Conference)
+        names = self._getDisplayNames(confs)
+        return ConferenceForms(
+            items=[self._copyConferenceToForm(conf,
+                                              names[conf.organizerUserId])
+                   for conf in confs],
+            missingKeys=missing
+        )
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(CONF_LIST_REQUEST, ConferenceForms,
                       path='getConferencesCreated',
                       http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
@@ -468,9 +746,17 @@ class ConferenceApi(remote.Service):
         # make profile key
         p_key = ndb.Key(Profile, getUserId(user))
         # create ancestor query for this user
-        conferences = Conference.query(ancestor=p_key)
+        if request.view == View.SUMMARY:
+            conferences = self.repository.conferencesByOrganizer(
+                p_key, self._projection(CONF_SUMMARY_FIELDS))
+            return ConferenceForms(
+                summaries=[self._copyConferenceToSummaryForm(conf)
+                           for conf in conferences]
+            )
+
+        conferences = self.repository.conferencesByOrganizer(p_key)
         # get the user profile and display name
-        prof = p_key.get()
+        prof = self.repository.get(p_key)
         displayName = getattr(prof, 'displayName')
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
@@ -514,12 +800,54 @@ class ConferenceApi(remote.Service):
                       name='queryConferences')
     def queryConferences(self, request):
         """Query for conferences."""
-        conferences = self._getQuery(request)
+        inequality_filter, filters = self._parseFilters(request)
+        if request.view == View.SUMMARY:
+            # equality filtered fields are known; don't project them
+            fixed = {f['field']: f['value'] for f in filters
+                     if f['operator'] == '=' and
+                     f['field'] in CONF_SUMMARY_FIELDS}
+            conferences = self.repository.queryConferences(
+                inequality_filter, filters,
+                self._projection(CONF_SUMMARY_FIELDS, fixed))
+            return ConferenceForms(
+                summaries=[self._copyConferenceToSummaryForm(conf, fixed)
+                           for conf in conferences]
+            )
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
             items=[self._copyConferenceToForm(conf, "")
-                   for conf in conferences]
+                   for conf in self.repository.queryConferences(
+                       inequality_filter, filters)]
+        )
+
+    @endpoints.method(UPCOMING_GET_REQUEST, ConferenceForms,
+                      path='conferences/upcoming',
+                      http_method='GET', name='upcomingConferences')
+    def upcomingConferences(self, request):
+        """Return conferences starting within the next `days` days,
+        ordered by start date and paged with pageToken."""
+        days = (UPCOMING_DEFAULT_DAYS if request.days is None
+                else request.days)
+        limit = (UPCOMING_DEFAULT_LIMIT if request.limit is None
+                 else request.limit)
+        if days <= 0 or limit <= 0:
+            raise endpoints.BadRequestException(
+                    "'days' and 'limit' must be positive.")
+        limit = min(limit, UPCOMING_MAX_LIMIT)
+
+        today = datetime.datetime.now().date()
+        last_day = today + datetime.timedelta(days=days)
+
+        try:
+            confs, token = self.repository.conferencesStartingBetween(
+                today, last_day, limit, request.pageToken)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException("Invalid pageToken.")
+
+        return ConferenceForms(
+            items=[self._copyConferenceToForm(conf, "") for conf in confs],
+            nextPageToken=token
         )
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -531,12 +859,12 @@ class ConferenceApi(remote.Service):
         prof = self._getProfileFromUser()  # get user Profile
         conf_keys = [ndb.Key(urlsafe=wsck)
                      for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
+        conferences = self.repository.getMulti(conf_keys)
 
         # get organizers
         organisers = [ndb.Key(Profile, conf.organizerUserId)
                       for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+        profiles = self.repository.getMulti(organisers)
 
         # put display names in a dict for easier fetching
         names = {}
@@ -566,12 +894,31 @@ class ConferenceApi(remote.Service):
 
         # get sessions with ancestor/parent conference key
         # query by kind with an ancestor filter
-        sessions = Session.query(ancestor=c_key)
-
+        if request.view == View.SUMMARY:
+            sessions = self.repository.sessionsOfConference(
+                c_key, projection=self._projection(SESS_SUMMARY_FIELDS))
+            return SessionForms(
+                summaries=[self._copySessionToSummaryForm(sess)
+                           for sess in sessions])
+
+        sessions = self.repository.sessionsOfConference(c_key)
         # return set of SessionForm objects per Conference
         return SessionForms(items=[self._copySessionToForm(sess)
                             for sess in sessions])
 
+    @endpoints.method(BATCH_GET_REQUEST, SessionForms,
+                      path='sessions/batch',
+                      http_method='GET', name='getSessions')
+    def getSessions(self, request):
+        """Return the requested sessions (by websafeKeys) in one call;
+        keys that could not be resolved are listed in missingKeys."""
+        sessions, missing = self._getMultiByWebsafeKeys(request.websafeKeys,
+                                                        Session)
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions],
+            missingKeys=missing
+        )
+
     @endpoints.method(SESS_GET_BY_TYPE_REQUEST, SessionForms,
                       http_method='GET', name='getConferenceSessionsByType')
     def getConferenceSessionsByType(self, request):
@@ -588,10 +935,9 @@ class ConferenceApi(remote.Service):
         c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
 
         # get sessions with ancestor/parent conference key
-        # query by kind with ancestor filter
-        sessions = Session.query(ancestor=c_key)
-        # filter by property: type
-        sessions = sessions.filter(Session.typeOfSession == request.type)
+        # query by kind with ancestor filter, by property: type
+        sessions = self.repository.sessionsOfConference(
+            c_key, typeOfSession=request.type)
 
         # return set of SessionForm objects per Conference
         return SessionForms(items=[self._copySessionToForm(sess)
@@ -604,10 +950,17 @@ class ConferenceApi(remote.Service):
         return all sessions given by this particular speaker,
         across all conferences"""
 
-        # get sessions - query by kind
-        sessions = Session.query()
-        # filter by property: speaker
-        sessions = sessions.filter(Session.speaker == request.speaker)
+        # get sessions - query by kind, filter by property: speaker
+        if request.view == View.SUMMARY:
+            fixed = {'speaker': request.speaker}
+            sessions = self.repository.sessionsBySpeaker(
+                request.speaker,
+                projection=self._projection(SESS_SUMMARY_FIELDS, fixed))
+            return SessionForms(
+                summaries=[self._copySessionToSummaryForm(sess, fixed)
+                           for sess in sessions])
+
+        sessions = self.repository.sessionsBySpeaker(request.speaker)
 
         # return set of SessionForm objects per Conference
         return SessionForms(items=[self._copySessionToForm(sess)
@@ -619,7 +972,7 @@ class ConferenceApi(remote.Service):
         """Return all sessions"""
 
         # get sessions - query by kind
-        sessions = Session.query()
+        sessions = self.repository.allSessions()
 
         # return set of SessionForm objects per Conference
         return SessionForms(items=[self._copySessionToForm(sess)
@@ -633,10 +986,8 @@ class ConferenceApi(remote.Service):
         # get curent date as datetime object
         current_date = datetime.datetime.now().date()
 
-        # get sessions - query by kind
-        sessions = Session.query()
-        # filter by property date
-        sessions = sessions.filter(Session.date < current_date)
+        # get sessions - query by kind, filter by property date
+        sessions = self.repository.sessionsBefore(current_date)
 
         # return set of SessionForm objects per Conference
         return SessionForms(items=[self._copySessionToForm(sess)
@@ -673,6 +1024,24 @@ class ConferenceApi(remote.Service):
         sf.check_initialized()
         return sf
 
+    def _copySessionToSummaryForm(self, sess, fixed=None):
+        """Copy summary fields from (projected) Session to
+        SessionSummaryForm; fixed holds values known from filters."""
+        ssf = SessionSummaryForm(websafeSessionKey=sess.key.urlsafe())
+        if sess.key.parent():
+            ssf.websafeConferenceKey = sess.key.parent().urlsafe()
+        for field in SESS_SUMMARY_FIELDS:
+            if fixed and field in fixed:
+                value = fixed[field]
+            else:
+                value = getattr(sess, field)
+            # convert Date/Time objects to strings; just copy others
+            if field in ('date', 'startTime') and value is not None:
+                value = str(value)
+            setattr(ssf, field, value)
+        ssf.check_initialized()
+        return ssf
+
     @endpoints.method(SESS_POST_REQUEST, SessionForm,
                       path='conference/{websafeConferenceKey}/session/new',
                       http_method='POST', name='createSession')
@@ -692,7 +1061,7 @@ class ConferenceApi(remote.Service):
         c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
 
         # check that conference object exists
-        conf = c_key.get()
+        conf = self.repository.get(c_key)
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' %
@@ -737,46 +1106,186 @@ class ConferenceApi(remote.Service):
             duration = datetime.timedelta(minutes=int(data['duration']))
             data['duration'] = (datetime.datetime.min + duration).time()
 
-        # Task queue for fatured speaker
-        if data['speaker']:
+        # allocate a session key with the conference key as parent
+        s_key = self.repository.allocateKey(Session, parent=c_key)
+        data['key'] = s_key
 
-            sessions = Session.query(ancestor=c_key)
-            sessions = sessions.filter(Session.speaker == data['speaker'])
+        # creation of Session with its (transactional) index tasks
+        def create():
+            featured = (data['speaker'] and
+                        self.repository.hasSessionBySpeaker(data['speaker'],
+                                                            c_key))
+            self.repository.put(Session(**data))
+            if data['speaker']:
+                self._queueAutocompleteUpdate('speaker',
+                                              added=[data['speaker']],
+                                              transactional=True)
+            self._queueSearchIndex(s_key.urlsafe(), transactional=True)
+            return featured
+
+        # Task queue for fatured speaker, once the session is stored;
+        # named after conference & speaker, so a retried request (or
+        # further sessions) do not feature them again
+        if self.repository.transaction(create):
+            self.repository.addTask(
+                params={'speaker': data['speaker']},
+                url='/tasks/set_featured_speaker',
+                name=taskName('featured_speaker', c_key.urlsafe(),
+                              data['speaker'])
+            )
 
-            if sessions.get():
-                taskqueue.add(
-                    params={'speaker': data['speaker']},               
-                    url='/tasks/set_featured_speaker'
-                )
+        # return (modified) SessionForm
+        return self._copySessionToForm(self.repository.get(s_key))
 
-        # allocate an id for session
-        s_id = Session.allocate_ids(size=1, parent=c_key)[0]
-        # create session key and set parent to conference key
-        s_key = ndb.Key(Session, s_id, parent=c_key)
-        data['key'] = s_key
+# - - - Autocomplete - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _queueAutocompleteUpdate(field, added=(), removed=(),
+                                 transactional=False):
+        """Enqueue an incremental autocomplete index refresh."""
+        placeholders = AUTOCOMPLETE_PLACEHOLDERS.get(field, ())
+        added = [term for term in added
+                 if term and term not in placeholders]
+        removed = [term for term in removed
+                   if term and term not in placeholders]
+        if not (added or removed):
+            return
+        ConferenceApi.repository.addTask(
+            params={'field': field, 'added': added, 'removed': removed},
+            url='/tasks/update_autocomplete',
+            transactional=transactional
+        )
+
+    @endpoints.method(AUTOCOMPLETE_GET_REQUEST, AutocompleteForm,
+                      path='autocomplete',
+                      http_method='GET', name='autocomplete')
+    def autocomplete(self, request):
+        """Return topics, cities or speakers starting with prefix
+        (field is one of CITY, TOPIC, SPEAKER)."""
+        try:
+            field = AUTOCOMPLETE_FIELDS[request.field]
+        except KeyError:
+            raise endpoints.BadRequestException(
+                        "Autocomplete field must be one of: %s" %
+                        ', '.join(sorted(AUTOCOMPLETE_FIELDS)))
+
+        return AutocompleteForm(items=autocompleteLookup(field,
+                                                         request.prefix))
+
+# - - - Search - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _queueSearchIndex(websafeKey, transactional=False):
+        """Enqueue (re)indexing of a Conference or Session document."""
+        ConferenceApi.repository.addTask(
+            params={'websafeKey': websafeKey},
+            url='/tasks/index_document',
+            transactional=transactional
+        )
 
-        # creation of Session & return (modified) SessionForm
-        s_key = Session(**data).put()
+    def _searchEntities(self, index_name, request):
+        """Run a ranked text search; return (entities, nextPageToken)."""
+        if not request.query:
+            raise endpoints.BadRequestException("'query' field required")
+        try:
+            keys, token = searchKeys(index_name, request.query,
+                                     request.limit, request.pageToken)
+        except (search.QueryError, ValueError):
+            raise endpoints.BadRequestException(
+                "Invalid search query or pageToken.")
+
+        # documents may briefly outlive their entities; skip those
+        entities = [entity for entity in self.repository.getMulti(keys)
+                    if entity]
+        return entities, token
+
+    @endpoints.method(SEARCH_REQUEST, ConferenceForms,
+                      path='search/conferences',
+                      http_method='GET', name='searchConferences')
+    def searchConferences(self, request):
+        """Full-text search over conference name, description,
+        topics and city, best matches first."""
+        confs, token = self._searchEntities(CONFERENCE_INDEX, request)
+        return ConferenceForms(
+            items=[self._copyConferenceToForm(conf, "") for conf in confs],
+            nextPageToken=token
+        )
 
-        return self._copySessionToForm(s_key.get())
+    @endpoints.method(SEARCH_REQUEST, SessionForms,
+                      path='search/sessions',
+                      http_method='GET', name='searchSessions')
+    def searchSessions(self, request):
+        """Full-text search over session name, highlights, speaker
+        and type, best matches first."""
+        sessions, token = self._searchEntities(SESSION_INDEX, request)
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions],
+            nextPageToken=token
+        )
 
 # - - - Wishlist - - - - - - - - - - - - - - - - - - - -
 
     # addSessionToWishlist(SessionKey)
-    @endpoints.method(WL_POST_REQUEST, ProfileForm,
+    @endpoints.method(WL_ADD_REQUEST, ProfileForm,
                       path='profile/wishlist/add/{sessionKey}',
                       http_method='POST', name='addSessionToWishlist')
     def addSessionToWishlist(self, request):
         """Adds the session to the user's list of sessions
-        they are interested in attending"""
+        they are interested in attending (optionally refusing sessions
+        that overlap ones already in the wishlist)"""
+        if request.checkConflicts:
+            self._checkWishlistConflicts(request.sessionKey)
         return self._addSessiontoWishlistObject(request)
 
-    @ndb.transactional()
+    def _getWishlistIntervals(self, prof):
+        """Return (start, end, Session) for wishlisted sessions with
+        known times, fetched in one batch."""
+        sessions = self.repository.getMulti(
+            [ndb.Key(urlsafe=wssk) for wssk in set(prof.sessionKeysToWishlist)])
+        intervals = []
+        for sess in sessions:
+            interval = sess and sessionInterval(sess)
+            if interval:
+                intervals.append(interval + (sess,))
+        return intervals
+
+    def _checkWishlistConflicts(self, sessionKey):
+        """Raise ConflictException if the session overlaps a session
+        already in the user's wishlist."""
+        session = self.repository.get(ndb.Key(urlsafe=sessionKey))
+        interval = session and sessionInterval(session)
+        if not interval:
+            return
+        start, end = interval
+        clashes = [sess.name for s, e, sess in
+                   self._getWishlistIntervals(self._getProfileFromUser())
+                   if s < end and start < e and sess.key != session.key]
+        if clashes:
+            raise ConflictException(
+                "Session overlaps wishlisted session(s): %s" %
+                ', '.join(clashes))
+
+    @endpoints.method(message_types.VoidMessage, SessionConflictForms,
+                      path='profile/wishlist/conflicts',
+                      http_method='GET', name='getWishlistConflicts')
+    def getWishlistConflicts(self, request):
+        """Return pairs of wishlisted sessions that overlap in time"""
+        prof = self._getProfileFromUser()
+        overlaps = findOverlaps(self._getWishlistIntervals(prof))
+        return SessionConflictForms(items=[
+            SessionConflictForm(
+                first=self._copySessionToSummaryForm(first),
+                second=self._copySessionToSummaryForm(second))
+            for first, second in overlaps])
+
     def _addSessiontoWishlistObject(self, request):
         """"Private method to handle add session to wishlist"""
+        return self.repository.transaction(
+            lambda: self._addSessionToWishlistTxn(request), xg=True)
 
+    def _addSessionToWishlistTxn(self, request):
         # check session exist
-        session = ndb.Key(urlsafe=request.sessionKey).get()
+        session = self.repository.get(ndb.Key(urlsafe=request.sessionKey))
         if not session:
             raise endpoints.NotFoundException(
                 'No session found with key: %s' % request.sessionKey)
@@ -784,9 +1293,11 @@ class ConferenceApi(remote.Service):
         # get profile
         prof = self._getProfileFromUser()
 
-        # add session key to wishlist
-        prof.sessionKeysToWishlist.append(request.sessionKey)
-        prof.put()
+        # add session key to wishlist (once) & count it
+        if request.sessionKey not in prof.sessionKeysToWishlist:
+            prof.sessionKeysToWishlist.append(request.sessionKey)
+            self.repository.put(prof)
+            self.repository.changePopularity(request.sessionKey, 1)
 
         return self._copyProfileToForm(prof)
 
@@ -799,12 +1310,14 @@ class ConferenceApi(remote.Service):
         they are interested in attending"""
         return self._deleteSessionInWishlistObject(request)
 
-    @ndb.transactional()
     def _deleteSessionInWishlistObject(self, request):
         """"Private method to handle delete session to wishlist"""
+        return self.repository.transaction(
+            lambda: self._deleteSessionInWishlistTxn(request), xg=True)
 
+    def _deleteSessionInWishlistTxn(self, request):
         # check session exist
-        session = ndb.Key(urlsafe=request.sessionKey).get()
+        session = self.repository.get(ndb.Key(urlsafe=request.sessionKey))
         if not session:
             raise endpoints.NotFoundException(
                 'No session found with key: %s' % request.sessionKey)
@@ -812,9 +1325,11 @@ class ConferenceApi(remote.Service):
         # get profile
         prof = self._getProfileFromUser()
 
-        # delete session key to wishlist
-        prof.sessionKeysToWishlist.remove(request.sessionKey)
-        prof.put()
+        # delete session key to wishlist & uncount it
+        if request.sessionKey in prof.sessionKeysToWishlist:
+            prof.sessionKeysToWishlist.remove(request.sessionKey)
+            self.repository.put(prof)
+            self.repository.changePopularity(request.sessionKey, -1)
 
         return self._copyProfileToForm(prof)        
 
@@ -828,18 +1343,129 @@ class ConferenceApi(remote.Service):
         prof = self._getProfileFromUser()
 
         # get session datastore objects
-        sessions = [ndb.Key(urlsafe=s_key).get()
-                    for s_key in prof.sessionKeysToWishlist]
+        sessions = self.repository.getMulti(
+            [ndb.Key(urlsafe=s_key) for s_key in prof.sessionKeysToWishlist])
 
         # return set of SessionForm objects per Conference
         return SessionForms(items=[self._copySessionToForm(sess)
                             for sess in sessions])
 
+    @endpoints.method(POPULAR_GET_REQUEST, SessionPopularityForms,
+                      path='sessions/popular',
+                      http_method='GET', name='getPopularSessions')
+    def getPopularSessions(self, request):
+        """Return the most wishlisted sessions of a conference (or of
+        all conferences if no websafeConferenceKey is given)"""
+        entries = self.repository.leaderboard(
+            request.websafeConferenceKey or LEADERBOARD_ALL)
+        sessions = self.repository.getMulti([ndb.Key(urlsafe=wssk)
+                                              for wssk, _ in entries])
+        return SessionPopularityForms(items=[
+            SessionPopularityForm(
+                session=self._copySessionToSummaryForm(sess),
+                wishlistCount=count)
+            for (_, count), sess in zip(entries, sessions) if sess])
+
+    @endpoints.method(RECOMMEND_GET_REQUEST, SessionRecommendationForms,
+                      path='sessions/{sessionKey}/recommended',
+                      http_method='GET', name='getRecommendedSessions')
+    def getRecommendedSessions(self, request):
+        """Return sessions most often wishlisted together with the given
+        session (precomputed offline)"""
+        recs = self.repository.get(
+            ndb.Key(SessionRecommendations, request.sessionKey))
+        return SessionRecommendationForms(items=[
+            SessionRecommendationForm(websafeSessionKey=wssk, name=name,
+                                      speaker=speaker, score=score)
+            for wssk, name, speaker, score in (recs.neighbours
+                                               if recs else [])])
+
+# - - - Agenda - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _decodeAgendaToken(pageToken, wscks):
+        """Return {wsck: cursor after the last session shown ('' if none
+        yet) or None (exhausted)}."""
+        if not pageToken:
+            return {wsck: '' for wsck in wscks}
+        try:
+            state = json.loads(base64.urlsafe_b64decode(str(pageToken)))
+            if not all(cursor is None or isinstance(cursor, basestring)
+                       for cursor in state.itervalues()):
+                raise ValueError(pageToken)
+        except (AttributeError, TypeError, ValueError):
+            raise endpoints.BadRequestException("Invalid pageToken.")
+        # conferences registered for since the first page start fresh
+        return {wsck: state.get(wsck, '') for wsck in wscks}
+
+    @endpoints.method(AGENDA_GET_REQUEST, SessionForms,
+                      path='profile/agenda',
+                      http_method='GET', name='getMyAgenda')
+    def getMyAgenda(self, request):
+        """Return sessions of all conferences the user attends as one
+        timeline ordered by date & startTime, wishlisted ones marked."""
+        prof = self._getProfileFromUser()
+        limit = min(request.limit or AGENDA_DEFAULT_LIMIT, AGENDA_MAX_LIMIT)
+        state = self._decodeAgendaToken(request.pageToken,
+                                        prof.conferenceKeysToAttend)
+
+        # one ordered query per conference, all in flight at once; each
+        # resumes right after the last session shown from it. One extra
+        # session tells whether a stream has more.
+        try:
+            timelines = self.repository.sessionTimelines(
+                {ndb.Key(urlsafe=wsck): cursor or None
+                 for wsck, cursor in state.iteritems()
+                 if cursor is not None},
+                limit + 1)
+        except (datastore_errors.BadValueError,
+                datastore_errors.BadRequestError):
+            # a cursor that does not decode, or is not from this query
+            raise endpoints.BadRequestException("Invalid pageToken.")
+
+        # (session, cursor after it) per stream
+        pages = {c_key.urlsafe(): page
+                 for c_key, page in timelines.iteritems()}
+
+        # k-way merge of the already ordered streams
+        streams = [[(sess.date, sess.startTime, wsck, i, sess)
+                    for i, (sess, _) in enumerate(page)]
+                   for wsck, page in pages.iteritems()]
+        merged = [entry[-1] for entry in heapq.merge(*streams)][:limit]
+
+        # advance each stream to just after what was shown from it
+        shown = {}
+        for sess in merged:
+            wsck = sess.key.parent().urlsafe()
+            shown[wsck] = shown.get(wsck, 0) + 1
+        for wsck, page in pages.iteritems():
+            used = shown.get(wsck, 0)
+            if used == len(page):
+                # all of it (at most limit, so nothing more) was shown
+                state[wsck] = None
+            elif used:
+                state[wsck] = page[used - 1][1]
+
+        token = None
+        if any(cursor is not None for cursor in state.itervalues()):
+            token = base64.urlsafe_b64encode(json.dumps(state))
+
+        wishlist = set(prof.sessionKeysToWishlist)
+        items = []
+        for sess in merged:
+            sf = self._copySessionToForm(sess)
+            sf.wishlisted = sf.websafeSessionKey in wishlist
+            items.append(sf)
+        return SessionForms(items=items, nextPageToken=token)
+
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
+        return self.repository.transaction(
+            lambda: self._conferenceRegistrationTxn(request, reg), xg=True)
+
+    def _conferenceRegistrationTxn(self, request, reg):
         retval = None
 
         # get user Profile
@@ -848,7 +1474,7 @@ class ConferenceApi(remote.Service):
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
         wsck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=wsck).get()
+        conf = self.repository.get(ndb.Key(urlsafe=wsck))
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
@@ -860,10 +1486,11 @@ class ConferenceApi(remote.Service):
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
+            # check if seats avail (seats held in checkout are taken)
+            if conf.seatsAvailable - self._liveHoldCount(conf.key) <= 0:
                 raise ConflictException(
-                    "There are no seats available.")
+                    "There are no seats available; "
+                    "join the waitlist instead.")
 
             # register user, take away one seat
             prof.conferenceKeysToAttend.append(wsck)
@@ -875,16 +1502,20 @@ class ConferenceApi(remote.Service):
             # check if user already registered
             if wsck in prof.conferenceKeysToAttend:
 
-                # unregister user, add back one seat
+                # unregister user, add back one seat & offer it to
+                # the waitlist once committed
                 prof.conferenceKeysToAttend.remove(wsck)
                 conf.seatsAvailable += 1
                 retval = True
+                self.repository.addTask(
+                    params={'websafeConferenceKey': wsck},
+                    url='/tasks/promote_waitlist', transactional=True)
             else:
                 retval = False
 
         # write things back to the datastore & return
-        prof.put()
-        conf.put()
+        self.repository.put(prof)
+        self.repository.put(conf)
         return BooleanMessage(data=retval)
 
     @endpoints.method(
@@ -893,8 +1524,270 @@ class ConferenceApi(remote.Service):
                     http_method='POST', name='registerForConference')
     def registerForConference(self, request):
         """Register user for selected conference."""
-        return self._conferenceRegistration(request)
+        result = self._conferenceRegistration(request)
+        CONFERENCE_CACHE.invalidate(request.websafeConferenceKey)
+        return result
+
+    @endpoints.method(
+                    CONF_GET_REQUEST, BooleanMessage,
+                    path='conference/{websafeConferenceKey}',
+                    http_method='DELETE', name='unregisterFromConference')
+    def unregisterFromConference(self, request):
+        """Unregister user for selected conference."""
+        result = self._conferenceRegistration(request, reg=False)
+        CONFERENCE_CACHE.invalidate(request.websafeConferenceKey)
+        return result
+
+# - - - Waitlist - - - - - - - - - - - - - - - - - - - -
 
+    @staticmethod
+    def _promoteWaitlist(wsck):
+        """Register the next waiters for freed seats, in one batch;
+        used by the promote_waitlist task. Returns the number promoted
+        and chains another task while seats & waiters remain."""
+        repository = ConferenceApi.repository
+        entries = repository.waitlist(wsck, WAITLIST_PROMOTE_BATCH)
+        if not entries:
+            return 0
+
+        def promote():
+            conf = repository.get(ndb.Key(urlsafe=wsck))
+            free = conf.seatsAvailable - repository.liveHoldCount(conf.key)
+            entries_now = repository.getMulti([e.key for e in entries])
+            profiles = repository.getMulti([ndb.Key(Profile, e.userId)
+                                            for e in entries])
+            promoted, puts = 0, []
+            for entry, prof in zip(entries_now, profiles):
+                if free <= 0:
+                    break
+                # entry left the waitlist since the query ran
+                if entry is None:
+                    continue
+                repository.delete(entry.key)
+                if prof is None or wsck in prof.conferenceKeysToAttend:
+                    continue
+                prof.conferenceKeysToAttend.append(wsck)
+                puts.append(prof)
+                free -= 1
+                promoted += 1
+            conf.seatsAvailable -= promoted
+            repository.putMulti(puts + [conf])
+            return promoted, free
+
+        promoted, free = repository.transaction(promote, xg=True)
+        CONFERENCE_CACHE.invalidate(wsck)
+        if free > 0 and len(entries) == WAITLIST_PROMOTE_BATCH:
+            repository.addTask(params={'websafeConferenceKey': wsck},
+                               url='/tasks/promote_waitlist')
+        return promoted
+
+    @endpoints.method(CONF_GET_REQUEST, WaitlistForm,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='POST', name='joinWaitlist')
+    def joinWaitlist(self, request):
+        """Queue the user for a seat at a sold out conference."""
+        prof = self._getProfileFromUser()
+        user_id = prof.key.id()
+        wsck = request.websafeConferenceKey
+        conf, _ = CONFERENCE_CACHE.get(
+            wsck, lambda: self._loadConference(wsck))
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        if conf.seatsAvailable - self._liveHoldCount(conf.key) > 0:
+            raise ConflictException(
+                "There are seats available; register instead.")
+
+        # one entry per user; joining again keeps the original place
+        key = ndb.Key(WaitlistEntry, '%s:%s' % (wsck, user_id))
+
+        def getOrInsert():
+            entry = self.repository.get(key)
+            if entry is None:
+                entry = WaitlistEntry(key=key, websafeConferenceKey=wsck,
+                                      userId=user_id)
+                self.repository.put(entry)
+            return entry
+
+        entry = self.repository.transaction(getOrInsert)
+        return WaitlistForm(websafeConferenceKey=wsck,
+                            position=self.repository.waitlistPosition(entry))
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='DELETE', name='leaveWaitlist')
+    def leaveWaitlist(self, request):
+        """Remove the user from a conference's waitlist."""
+        prof = self._getProfileFromUser()
+        key = ndb.Key(WaitlistEntry, '%s:%s' % (
+            request.websafeConferenceKey, prof.key.id()))
+        if not self.repository.get(key):
+            return BooleanMessage(data=False)
+        self.repository.delete(key)
+        return BooleanMessage(data=True)
+
+# - - - Seat holds - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _liveHoldCount(c_key):
+        """Return the number of unexpired seat holds on a conference."""
+        return ConferenceApi.repository.liveHoldCount(c_key)
+
+    @staticmethod
+    def _sweepExpiredHolds():
+        """Delete expired seat holds in batches; used by the sweeper
+        cron job. Offers the freed seats to the waitlists and returns
+        the number of holds deleted."""
+        repository = ConferenceApi.repository
+        now = datetime.datetime.now()
+        deleted, cursor, more = 0, None, True
+        freed = set()
+        while more:
+            keys, cursor = repository.expiredHoldKeys(
+                now, SEAT_HOLD_SWEEP_BATCH, cursor)
+            repository.deleteMulti(keys)
+            deleted += len(keys)
+            freed.update(key.parent().urlsafe() for key in keys)
+            more = cursor is not None
+        for wsck in freed:
+            repository.addTask(params={'websafeConferenceKey': wsck},
+                               url='/tasks/promote_waitlist')
+        return deleted
+
+    def _copySeatHoldToForm(self, hold):
+        """Copy relevant fields from SeatHold to SeatHoldForm."""
+        return SeatHoldForm(websafeHoldKey=hold.key.urlsafe(),
+                            websafeConferenceKey=hold.key.parent().urlsafe(),
+                            expires=str(hold.expires))
+
+    def _getOwnHold(self, websafeHoldKey, user_id):
+        """Return the caller's SeatHold for websafeHoldKey or raise."""
+        try:
+            hold = self.repository.get(ndb.Key(urlsafe=websafeHoldKey))
+        except Exception:
+            hold = None
+        if not isinstance(hold, SeatHold) or hold.userId != user_id:
+            raise endpoints.NotFoundException(
+                'No seat hold found with key: %s' % websafeHoldKey)
+        return hold
+
+    def _holdSeatObject(self, request):
+        """Reserve a seat for the user until the hold expires.
+
+        Holds are children of the Conference, so the seat check sees
+        every live hold and commits with the new one in a single group
+        transaction. That also means holds, confirmations and
+        registrations of one conference serialize on its entity group
+        (roughly one write per second sustained); contended calls are
+        retried by ndb and then fail with TransactionFailedError.
+        """
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        # the profile is read outside, keeping the transaction to the
+        # conference group
+        return self.repository.transaction(
+            lambda: self._holdSeatTxn(wsck, prof.key.id()))
+
+    def _holdSeatTxn(self, wsck, user_id):
+        conf = self.repository.get(ndb.Key(urlsafe=wsck))
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        now = datetime.datetime.now()
+        holds = self.repository.liveHolds(conf.key)
+        # a user keeps (at most) one live hold per conference
+        for hold in holds:
+            if hold.userId == user_id:
+                return self._copySeatHoldToForm(hold)
+        if conf.seatsAvailable - len(holds) <= 0:
+            raise ConflictException("There are no seats available.")
+
+        hold = SeatHold(parent=conf.key, userId=user_id,
+                        expires=now + datetime.timedelta(
+                            seconds=SEAT_HOLD_SECONDS))
+        self.repository.put(hold)
+        return self._copySeatHoldToForm(hold)
+
+    def _confirmSeatHoldObject(self, request):
+        """Turn a live hold into a registration."""
+        return self.repository.transaction(
+            lambda: self._confirmSeatHoldTxn(request), xg=True)
+
+    def _confirmSeatHoldTxn(self, request):
+        prof = self._getProfileFromUser()
+        hold = self._getOwnHold(request.websafeHoldKey, prof.key.id())
+        if hold.expires <= datetime.datetime.now():
+            self.repository.delete(hold.key)
+            raise ConflictException("The seat hold has expired.")
+
+        conf = self.repository.get(hold.key.parent())
+        wsck = conf.key.urlsafe()
+        if wsck not in prof.conferenceKeysToAttend:
+            # the held seat was never taken from seatsAvailable
+            prof.conferenceKeysToAttend.append(wsck)
+            conf.seatsAvailable -= 1
+            self.repository.putMulti([prof, conf])
+        self.repository.delete(hold.key)
+        return BooleanMessage(data=True)
+
+    @endpoints.method(CONF_GET_REQUEST, SeatHoldForm,
+                      path='conference/{websafeConferenceKey}/hold',
+                      http_method='POST', name='holdSeat')
+    def holdSeat(self, request):
+        """Hold a seat for the user while they check out."""
+        return self._holdSeatObject(request)
+
+    @endpoints.method(HOLD_POST_REQUEST, BooleanMessage,
+                      path='hold/{websafeHoldKey}/confirm',
+                      http_method='POST', name='confirmSeatHold')
+    def confirmSeatHold(self, request):
+        """Register the user for the conference of a live seat hold."""
+        result = self._confirmSeatHoldObject(request)
+        CONFERENCE_CACHE.invalidate(
+            ndb.Key(urlsafe=request.websafeHoldKey).parent().urlsafe())
+        return result
+
+    @endpoints.method(HOLD_POST_REQUEST, BooleanMessage,
+                      path='hold/{websafeHoldKey}/release',
+                      http_method='POST', name='releaseSeatHold')
+    def releaseSeatHold(self, request):
+        """Give up a seat hold before it expires."""
+        prof = self._getProfileFromUser()
+        hold = self._getOwnHold(request.websafeHoldKey, prof.key.id())
+        self.repository.delete(hold.key)
+        # offer the seat to the waitlist
+        self.repository.addTask(
+            params={'websafeConferenceKey': hold.key.parent().urlsafe()},
+            url='/tasks/promote_waitlist')
+        return BooleanMessage(data=True)
+
+    @endpoints.method(CONF_GET_REQUEST, SeatAvailabilityForm,
+                      path='conference/{websafeConferenceKey}/availability',
+                      http_method='GET', name='getSeatAvailability')
+    def getSeatAvailability(self, request):
+        """Return free seats (net of live holds) and held seats."""
+        wsck = request.websafeConferenceKey
+        conf, _ = CONFERENCE_CACHE.get(
+            wsck, lambda: self._loadConference(wsck))
+        held = self._liveHoldCount(conf.key)
+        return SeatAvailabilityForm(
+            seatsAvailable=max(conf.seatsAvailable - held, 0),
+            seatsHeld=held)
+
+
+registerCachedValue(MEMCACHE_ANNOUNCEMENTS_KEY,
+                    ConferenceApi._computeAnnouncement,
+                    ANNOUNCEMENT_SOFT_TTL)
+registerCachedValue(MEMCACHE_SPEAKER_KEY,
+                    ConferenceApi._computeFeaturedSpeaker,
+                    SPEAKER_SOFT_TTL)
+
+# profiles a sample of requests when PROFILE_SAMPLE_RATE is set
+profileService(ConferenceApi)
 
 # registers API
 api = endpoints.api_server([ConferenceApi])
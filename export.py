@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+export.py -- Udacity conference server-side Python App Engine
+    newline-delimited JSON export of conferences, sessions & registrations
+
+Each kind is walked with query cursors in bounded batches so a dump runs
+in constant memory. The last line of every export is a checkpoint record
+holding the cursor to resume from (empty once the kind is exhausted).
+"""
+
+import datetime
+import json
+import zlib
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import Conference
+from models import Session
+
+EXPORT_BATCH_SIZE = 200
+EXPORT_MAX_BATCHES = 50
+
+# - - - Serializers - - - - - - - - - - - - - - - - - - - -
+
+
+def _toJson(value):
+    """Convert datastore property values to JSON friendly values."""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, ndb.Key):
+        return value.urlsafe()
+    return value
+
+
+def _entityRows(entity):
+    """Return export rows (dicts) for a Conference or Session entity."""
+    row = {name: _toJson(value)
+           for name, value in entity.to_dict().iteritems()}
+    row['websafeKey'] = entity.key.urlsafe()
+    return [row]
+
+
+def _registrationRows(profile):
+    """Return one export row per conference a Profile is attending."""
+    return [{'userId': profile.key.id(), 'websafeConferenceKey': wsck}
+            for wsck in profile.conferenceKeysToAttend]
+
+
+EXPORT_KINDS = {
+    'conferences': (Conference, _entityRows),
+    'sessions': (Session, _entityRows),
+    'registrations': (Profile, _registrationRows),
+}
+
+# - - - Export generators - - - - - - - - - - - - - - - - - - - -
+
+
+def exportLines(kind, cursor=None, batch_size=EXPORT_BATCH_SIZE,
+                max_batches=EXPORT_MAX_BATCHES):
+    """Return an iterator of NDJSON lines for kind, starting at websafe
+    cursor.
+
+    At most max_batches batches of batch_size entities are read; the final
+    line is always {"_checkpoint": <websafe cursor or "">}. A cursor that
+    does not decode raises datastore_errors.BadValueError right away,
+    before anything is streamed.
+    """
+    model, to_rows = EXPORT_KINDS[kind]
+    start = Cursor(urlsafe=cursor) if cursor else None
+    return _exportLines(model, to_rows, start, batch_size, max_batches)
+
+
+def _exportLines(model, to_rows, start, batch_size, max_batches):
+    # order by key so the cursor is stable across resumes
+    q = model.query().order(model.key)
+
+    more = True
+    for _ in xrange(max_batches):
+        entities, start, more = q.fetch_page(batch_size, start_cursor=start)
+        for entity in entities:
+            for row in to_rows(entity):
+                yield json.dumps(row, sort_keys=True) + '\n'
+        if not more:
+            break
+
+    checkpoint = start.urlsafe() if (more and start) else ''
+    yield json.dumps({'_checkpoint': checkpoint}) + '\n'
+
+
+def gzipLines(lines):
+    """Gzip-compress an iterable of lines incrementally."""
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for line in lines:
+        chunk = compressor.compress(line)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+fanout.py -- Udacity conference server-side Python App Engine
+    fan-out of conference update notifications to attendees
+
+A material conference change records a NotificationFanout (a child of the
+conference, so it is written in the update transaction) and enqueues its
+first walker task. Each walker task reads one cursor batch of attending
+Profiles, enqueues one mail task for the batch on the rate limited
+attendee-notifications queue, checkpoints progress and chains the next
+walker task.
+"""
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import NotificationFanout
+from models import Profile
+from tasks import addTask
+from tasks import taskName
+
+FANOUT_BATCH_SIZE = 100
+FANOUT_DELAY = 1
+FANOUT_URL = '/tasks/fanout_notifications'
+NOTIFY_URL = '/tasks/send_notifications'
+NOTIFY_QUEUE = 'attendee-notifications'
+
+# changes to these Conference properties are worth telling attendees about
+MATERIAL_FIELDS = ('startDate', 'endDate', 'city')
+
+NOTIFY_SUBJECT = 'Conference update: %s'
+NOTIFY_BODY = ('Hi, a conference you are registered for has '
+               'changed:\r\n\r\n%s')
+
+
+def describeChanges(old, new):
+    """Return a line per material field that differs between the old and
+    new {field: value} snapshots (empty if nothing material changed)."""
+    return ['%s changed from %s to %s' % (field, old[field], new[field])
+            for field in MATERIAL_FIELDS if old[field] != new[field]]
+
+
+def startFanout(conf, changes):
+    """Record & enqueue a notification fan-out for conf; must run inside
+    the transaction updating conf."""
+    f_id = NotificationFanout.allocate_ids(size=1, parent=conf.key)[0]
+    fanout = NotificationFanout(
+        key=ndb.Key(NotificationFanout, f_id, parent=conf.key),
+        subject=NOTIFY_SUBJECT % conf.name,
+        body=NOTIFY_BODY % '\r\n'.join(changes))
+    fanout.put()
+    # transactional tasks cannot be named; later batches are
+    addTask(params={'fanout': fanout.key.urlsafe(), 'batch': 0},
+            url=FANOUT_URL, transactional=True)
+
+
+def _enqueueBatch(websafeFanoutKey, batch):
+    """Enqueue batch number batch of a fan-out, at most once."""
+    addTask(params={'fanout': websafeFanoutKey, 'batch': batch},
+            url=FANOUT_URL, countdown=FANOUT_DELAY,
+            name=taskName('fanout', websafeFanoutKey, batch))
+
+
+def runFanoutBatch(websafeFanoutKey, batch):
+    """Enqueue notifications for one batch of attendees & chain the next."""
+    fanout = ndb.Key(urlsafe=websafeFanoutKey).get()
+    if not fanout or fanout.done:
+        return
+    # batch already checkpointed; chaining the next one may have failed
+    if fanout.batches == batch + 1:
+        _enqueueBatch(websafeFanoutKey, fanout.batches)
+        return
+    # ignore stale or duplicate deliveries of an older batch
+    if fanout.batches != batch:
+        return
+
+    wsck = fanout.key.parent().urlsafe()
+    start = Cursor(urlsafe=fanout.cursor) if fanout.cursor else None
+    profiles, cursor, more = Profile.query(
+        Profile.conferenceKeysToAttend == wsck
+    ).order(Profile.key).fetch_page(FANOUT_BATCH_SIZE, start_cursor=start)
+
+    emails = [prof.mainEmail for prof in profiles if prof.mainEmail]
+    if emails:
+        addTask(params={'fanout': websafeFanoutKey, 'email': emails},
+                url=NOTIFY_URL, queue_name=NOTIFY_QUEUE,
+                name=taskName('notify', websafeFanoutKey, batch))
+
+    fanout.batches += 1
+    fanout.recipients += len(emails)
+    fanout.cursor = cursor.urlsafe() if cursor else None
+    fanout.done = not more
+    fanout.put()
+
+    if more:
+        _enqueueBatch(websafeFanoutKey, batch + 1)
+
+
+def sendNotifications(websafeFanoutKey, emails):
+    """Mail a fan-out's update notification to a batch of attendees."""
+    # only notification tasks need these; keep them out of start-up
+    from google.appengine.api import app_identity
+    from google.appengine.api import mail
+
+    fanout = ndb.Key(urlsafe=websafeFanoutKey).get()
+    if not fanout:
+        return
+    sender = 'noreply@%s.appspotmail.com' % app_identity.get_application_id()
+    for email in emails:
+        mail.send_mail(sender, email, fanout.subject, fanout.body)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""
+hotcache.py -- Udacity conference server-side Python App Engine
+    per-instance LRU cache with request coalescing for hot entities
+
+Instances are threadsafe (app.yaml), so concurrent requests for the same
+key share a single load ("single flight"). Entries live for a short TTL;
+after that they are revalidated against a version counter in memcache
+that writers bump, and only reloaded when the version changed.
+"""
+
+import collections
+import threading
+import time
+
+from google.appengine.api import memcache
+
+MEMCACHE_VERSION_KEY = "VERSION %s"
+
+
+def _freshVersion():
+    """Return a version no earlier counter value can be equal to."""
+    return int(time.time() * 1000000)
+
+
+def getVersion(key):
+    """Return the current write version of key, starting a fresh one if
+    memcache lost it (so entries cached under the old one reload)."""
+    version = memcache.get(MEMCACHE_VERSION_KEY % key)
+    if version is None:
+        version = _freshVersion()
+        if not memcache.add(MEMCACHE_VERSION_KEY % key, version):
+            # another instance started it first
+            version = memcache.get(MEMCACHE_VERSION_KEY % key) or version
+    return version
+
+
+def bumpVersion(key):
+    """Mark key as changed for every instance's HotCache."""
+    memcache.incr(MEMCACHE_VERSION_KEY % key,
+                  initial_value=_freshVersion())
+
+
+class _Flight(object):
+    """A load in progress that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class HotCache(object):
+    """Size-bounded LRU of (value, version, expiry) with single-flight
+    loading; safe to share between request threads."""
+
+    def __init__(self, maxSize, ttl):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._flights = {}
+
+    def get(self, key, load):
+        """Return the value for key, calling load() at most once for all
+        threads asking for the same stale or missing key."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # re-insert as most recently used
+                self._entries[key] = entry
+                if entry[2] > time.time():
+                    return entry[0]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            version = getVersion(key)
+            if entry is not None and entry[1] == version:
+                value = entry[0]
+            else:
+                value = load()
+            flight.value = value
+            self._store(key, value, version)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return value
+
+    def _store(self, key, value, version):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, version, time.time() + self.ttl)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop key locally and bump its version for other instances."""
+        with self._lock:
+            self._entries.pop(key, None)
+        bumpVersion(key)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+index_footprint.py -- Udacity conference server-side Python App Engine
+    composite indexes needed by queryConferences & their write cost
+
+Enumerates every filter combination queryConferences accepts, plans each
+one with queryplan.py and prints the minimal composite index set next to
+the one a fully index-served query would need. Then it checks the
+Conference indexes in index.yaml against the plan:
+
+    python index_footprint.py [--index-yaml index.yaml] [--topics 2]
+
+Write cost is counted in index rows per Conference put. A composite index
+has a row for every combination of its properties' values, so repeated
+topics multiply it (--topics is the assumed number per conference).
+Creating an entity writes each row once. An update that changes an
+indexed value deletes & rewrites the rows involving it.
+
+Needs PyYAML (bundled with the App Engine SDK).
+"""
+
+import argparse
+import itertools
+import os
+
+import yaml
+
+from queryplan import PLAN_FIELD_RANK
+from queryplan import PLAN_SORT
+from queryplan import PLAN_SUMMARY_FIELDS
+from queryplan import planConferenceQuery
+from queryplan import projectedIndex
+
+REPEATED_FIELDS = ('topics',)
+
+
+def supportedShapes():
+    """Yield (inequality field or None, equality fields) for every
+    combination of at most one filter per field."""
+    for inequality in (None,) + PLAN_FIELD_RANK:
+        others = [f for f in PLAN_FIELD_RANK if f != inequality]
+        for n in xrange(len(others) + 1):
+            for equalities in itertools.combinations(others, n):
+                yield inequality, equalities
+
+
+def _filters(inequality, equalities):
+    filters = [{'field': f, 'operator': '=', 'value': None}
+               for f in equalities]
+    if inequality:
+        filters.append({'field': inequality, 'operator': '>',
+                        'value': None})
+    return filters
+
+
+def fullIndex(inequality, equalities):
+    """Return the composite index serving a shape entirely from the
+    Datastore (equality properties, inequality, sort), or None."""
+    props = tuple(sorted(equalities))
+    if inequality:
+        props += (inequality,)
+    return props + (PLAN_SORT,) if props else None
+
+
+def plannedIndex(inequality, equalities):
+    """Return the composite index the planned query needs, or None."""
+    return planConferenceQuery(inequality,
+                               _filters(inequality, equalities)).index
+
+
+def summaryIndex(inequality, equalities):
+    """Return the composite index the projected SUMMARY view of the
+    planned query needs, or None if it is not projected or needs only
+    built-in indexes."""
+    plan = planConferenceQuery(inequality, _filters(inequality, equalities))
+    if plan.remainder:
+        return None
+    projection = [f for f in PLAN_SUMMARY_FIELDS if f not in equalities]
+    return projectedIndex(plan, projection)
+
+
+def rowsPerPut(index, topics):
+    """Return the rows an entity has in index."""
+    rows = 1
+    for prop in index:
+        if prop in REPEATED_FIELDS:
+            rows *= topics
+    return rows
+
+
+def readConferenceIndexes(path):
+    """Return the Conference composite indexes in index.yaml, as
+    (properties, ancestor, all ascending) tuples."""
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    indexes = []
+    for index in config.get('indexes') or []:
+        if index.get('kind') != 'Conference':
+            continue
+        props = index.get('properties') or []
+        indexes.append((
+            tuple(p['name'] for p in props),
+            bool(index.get('ancestor')),
+            all(p.get('direction', 'asc') == 'asc' for p in props)))
+    return indexes
+
+
+def _isQueryShaped(props, ancestor, ascending):
+    """Return True if an index could only be serving queryConferences."""
+    return (not ancestor and ascending and props[-1] == PLAN_SORT and
+            all(p in PLAN_FIELD_RANK for p in props[:-1]))
+
+
+def _describe(props):
+    return 'Conference(%s)' % ', '.join(props)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index-yaml', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'index.yaml'))
+    parser.add_argument('--topics', type=int, default=2,
+                        help='topics per conference (default 2)')
+    args = parser.parse_args()
+
+    shapes = list(supportedShapes())
+    full = set(fullIndex(*shape) for shape in shapes) - set([None])
+    planned = set(plannedIndex(*shape) for shape in shapes) - set([None])
+    planned |= set(summaryIndex(*shape) for shape in shapes) - set([None])
+
+    print '%d supported filter combinations' % len(shapes)
+    for label, indexes in (('fully index-served', full),
+                           ('planned', planned)):
+        print '  %-20s %4d indexes %6d rows/put' % (
+            label, len(indexes),
+            sum(rowsPerPut(index, args.topics) for index in indexes))
+
+    print
+    print 'Planned index set:'
+    for index in sorted(planned):
+        print '  %-58s %3d rows/put' % (_describe(index),
+                                        rowsPerPut(index, args.topics))
+
+    print
+    print 'Conference indexes in %s:' % args.index_yaml
+    current = readConferenceIndexes(args.index_yaml)
+    declared = set(props for props, ancestor, _ in current
+                   if not ancestor)
+    kept = 0
+    for props, ancestor, ascending in current:
+        if not ancestor and props in planned:
+            status = 'keep'
+        elif _isQueryShaped(props, ancestor, ascending):
+            status = 'remove'
+        else:
+            status = 'other'
+        if status != 'remove':
+            kept += rowsPerPut(props, args.topics)
+        print '  %-7s %-58s %3d rows/put' % (
+            status, _describe(props) + (' [ancestor]' if ancestor else ''),
+            rowsPerPut(props, args.topics))
+    missing = sorted(planned - declared)
+    for index in missing:
+        kept += rowsPerPut(index, args.topics)
+        print '  %-7s %-58s %3d rows/put' % (
+            'missing', _describe(index), rowsPerPut(index, args.topics))
+
+    print
+    print 'Composite index rows per Conference put: %d now, %d planned' % (
+        sum(rowsPerPut(props, args.topics) for props, _, _ in current),
+        kept)
+
+
+if __name__ == '__main__':
+    main()
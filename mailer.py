@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+mailer.py -- Udacity conference server-side Python App Engine
+    batched conference confirmation email delivery from a pull queue
+
+Conference creation adds a small JSON task to the confirmation-emails
+pull queue. A cron driven worker leases those tasks in batches, folds
+all conferences of one organizer into a single email and skips
+conferences already confirmed within MAIL_DEDUPE_SECONDS. Duplicates are
+tracked per recipient and conference, so a redelivered task is dropped
+but a recipient's new conferences are still confirmed.
+"""
+
+import json
+import logging
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+
+MAIL_QUEUE = 'confirmation-emails'
+MAIL_LEASE_SECONDS = 60
+MAIL_BATCH_SIZE = 100
+MAIL_TIME_BUDGET = 45
+MAIL_DEDUPE_SECONDS = 60 * 60
+MEMCACHE_MAIL_SENT_KEY = "MAIL SENT %s %s"
+
+CONFIRMATION_SUBJECT = 'You created a new Conference!'
+CONFIRMATION_BODY = ('Hi, you have created the following '
+                     'conference(s):\r\n\r\n%s')
+CONFIRMATION_LINE = '- %(name)s (%(city)s, %(startDate)s - %(endDate)s)'
+
+
+def queueConfirmationEmail(email, conf, transactional=False):
+    """Queue a creation confirmation for conf (a dict of its fields);
+    if transactional, only once the caller's transaction commits."""
+    payload = {'email': email}
+    payload.update({field: conf.get(field)
+                    for field in ('name', 'city', 'startDate', 'endDate',
+                                  'websafeKey')})
+    taskqueue.Queue(MAIL_QUEUE).add(taskqueue.Task(
+        payload=json.dumps(payload), method='PULL'),
+        transactional=transactional)
+
+
+def _render(confs):
+    lines = [CONFIRMATION_LINE % {
+                 'name': conf.get('name'),
+                 'city': conf.get('city') or '-',
+                 'startDate': conf.get('startDate') or '?',
+                 'endDate': conf.get('endDate') or '?'}
+             for conf in confs]
+    return CONFIRMATION_BODY % '\r\n'.join(lines)
+
+
+def sendConfirmationEmails():
+    """Drain the confirmation-emails queue in batches; return stats."""
+    # only the mail cron needs these; keep them out of instance start-up
+    from google.appengine.api import app_identity
+    from google.appengine.api import mail
+
+    queue = taskqueue.Queue(MAIL_QUEUE)
+    sender = 'noreply@%s.appspotmail.com' % app_identity.get_application_id()
+    stats = {'leased': 0, 'sent': 0, 'duplicates': 0}
+    started = time.time()
+
+    while time.time() - started < MAIL_TIME_BUDGET:
+        tasks = queue.lease_tasks(MAIL_LEASE_SECONDS, MAIL_BATCH_SIZE)
+        if not tasks:
+            break
+        stats['leased'] += len(tasks)
+
+        confs = [json.loads(task.payload) for task in tasks]
+        sent_keys = [MEMCACHE_MAIL_SENT_KEY % (conf['email'],
+                                               conf.get('websafeKey'))
+                     for conf in confs]
+        already_sent = memcache.get_multi(sent_keys)
+
+        # group by recipient, dropping conferences confirmed recently
+        pending = {}
+        for sent_key, conf in zip(sent_keys, confs):
+            if sent_key in already_sent:
+                stats['duplicates'] += 1
+                continue
+            already_sent[sent_key] = 1
+            recipient = pending.setdefault(conf['email'], ([], []))
+            recipient[0].append(conf)
+            recipient[1].append(sent_key)
+
+        for email, (recipient_confs, keys) in pending.iteritems():
+            mail.send_mail(sender, email, CONFIRMATION_SUBJECT,
+                           _render(recipient_confs))
+            # remember it went out right away, in case a later send fails
+            memcache.set_multi(dict.fromkeys(keys, 1),
+                               time=MAIL_DEDUPE_SECONDS)
+            stats['sent'] += 1
+
+        queue.delete_tasks(tasks)
+
+    elapsed = time.time() - started
+    stats['seconds'] = round(elapsed, 2)
+    logging.info('Confirmation emails: %(leased)d leased, %(sent)d sent, '
+                 '%(duplicates)d duplicates in %(seconds).2fs', stats)
+    return stats
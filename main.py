@@ -12,21 +12,77 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
-import webapp2
+import importlib
+import json
+import logging
+import time
 
-from google.appengine.api import app_identity
-from google.appengine.api import mail
-from google.appengine.api import memcache
+import webapp2
+from google.appengine.api import datastore_errors
 
+from autocomplete import recordTerms
+from cache import CACHED_VALUES
+from cache import getCacheStats
+from cache import refreshCachedValue
 from conference import ConferenceApi
+from export import EXPORT_KINDS
+from export import exportLines
+from export import gzipLines
+from fanout import runFanoutBatch
+from fanout import sendNotifications
+from mailer import sendConfirmationEmails
+from mapper import runBatch
+from mapper import startMapper
+from models import MapperJob
+from popularity import runLeaderboardBatch
+from popularity import startLeaderboardBuild
+from profiler import clearProfiles
+from profiler import getProfiles
+from profiler import profileApplication
+from recommendations import runBuildBatch
+from recommendations import startBuild
+from tasks import idempotent
+from tasks import purgeProcessedTasks
+from textsearch import indexEntity
+
+# imported on first use elsewhere; warmup loads them off the request path
+WARMUP_MODULES = (
+    'google.appengine.api.app_identity',
+    'google.appengine.api.mail',
+    'google.appengine.api.urlfetch',
+)
 
-MEMCACHE_SPEAKER_KEY = "RECENT SPEAKER"
+# - - - Warmup - - - - - - - - - - - - - - - - - - - -
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Load deferred modules & prime caches on a new instance
+        (importing this module already built the API server)."""
+        started = time.time()
+        for module in WARMUP_MODULES:
+            importlib.import_module(module)
+        cached = ConferenceApi._primeCaches()
+        logging.info('Warmed up in %.3fs; cached %d conferences.',
+                     time.time() - started, cached)
 
 # - - - Confirmation Email - - - - - - - - - - - - - - - - - - - -
 
+class SendConfirmationEmailsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Send queued Conference confirmation emails in batches."""
+        stats = sendConfirmationEmails()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(stats))
+
+
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
+    @idempotent
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation (push tasks
+        enqueued before the confirmation-emails pull queue)."""
+        from google.appengine.api import app_identity
+        from google.appengine.api import mail
+
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -45,19 +101,221 @@ class SetAnnouncementHandler(webapp2.RequestHandler):
         # use _cacheAnnouncement() to set announcement in Memcache
         ConferenceApi._cacheAnnouncement()
 
+# - - - Seat holds - - - - - - - - - - - - - - - - - - - -
+
+class SweepSeatHoldsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete expired seat holds."""
+        deleted = ConferenceApi._sweepExpiredHolds()
+        logging.info('Swept %d expired seat holds.', deleted)
+
+# - - - Waitlist - - - - - - - - - - - - - - - - - - - -
+
+class PromoteWaitlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Register waiters for seats freed by an unregistration."""
+        promoted = ConferenceApi._promoteWaitlist(
+            self.request.get('websafeConferenceKey'))
+        logging.info('Promoted %d waitlisted users.', promoted)
+
+# - - - Leaderboards - - - - - - - - - - - - - - - - - - - -
+
+class StartLeaderboardsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start recomputing most wishlisted session leaderboards."""
+        build = startLeaderboardBuild()
+        logging.info('Started leaderboard build %d.', build.key.id())
+
+
+class MaterializeLeaderboardsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Process one batch of a leaderboard build."""
+        runLeaderboardBatch(int(self.request.get('build')),
+                            int(self.request.get('batch')))
+
+# - - - Recommendations - - - - - - - - - - - - - - - - - - - -
+
+class StartRecommendationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start an offline session recommendation build."""
+        build = startBuild()
+        logging.info('Started recommendation build %d.', build.key.id())
+
+
+class BuildRecommendationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Process one batch of a recommendation build."""
+        runBuildBatch(int(self.request.get('build')),
+                      int(self.request.get('batch')))
+
 # - - - Featured Speaker - - - - - - - - - - - - - - - - - - - -
 
 class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
+    @idempotent
     def post(self):
         """Set Announcement in Memcache."""
 
-        # add as featured speaker and set it in memcache
-        announcement = "Featured speaker: %s" % self.request.get('speaker')
-        memcache.set(MEMCACHE_SPEAKER_KEY, announcement)
+        # store as featured speaker and set it in memcache
+        ConferenceApi._cacheFeaturedSpeaker(self.request.get('speaker'))
+
+# - - - Cache refresh - - - - - - - - - - - - - - - - - - - -
+
+class RefreshCacheHandler(webapp2.RequestHandler):
+    def post(self):
+        """Recompute a stale cached value in the background."""
+        key = self.request.get('key')
+        if key in CACHED_VALUES:
+            refreshCachedValue(key)
+
+
+class CacheStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report hit/stale/miss/rebuild counts of cached values."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(
+            {key: getCacheStats(key) for key in CACHED_VALUES}))
+
+# - - - Profiling - - - - - - - - - - - - - - - - - - - -
+
+class ProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report sampled per-endpoint profiles, hottest functions
+        first."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(getProfiles()))
+
+    def post(self):
+        """Drop collected profiles (e.g. before comparing a change)."""
+        clearProfiles()
+
+# - - - Task records - - - - - - - - - - - - - - - - - - - -
+
+class PurgeProcessedTasksHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete expired idempotency records of handled tasks."""
+        deleted = purgeProcessedTasks()
+        logging.info('Purged %d processed task records.', deleted)
+
+# - - - Autocomplete - - - - - - - - - - - - - - - - - - - -
+
+class UpdateAutocompleteHandler(webapp2.RequestHandler):
+    @idempotent
+    def post(self):
+        """Apply added/removed terms to the autocomplete index."""
+        recordTerms(self.request.get('field'),
+                    added=self.request.get_all('added'),
+                    removed=self.request.get_all('removed'))
+
+# - - - Search - - - - - - - - - - - - - - - - - - - -
+
+class IndexDocumentHandler(webapp2.RequestHandler):
+    def post(self):
+        """(Re)index a Conference or Session in the Search API."""
+        indexEntity(self.request.get('websafeKey'))
+
+# - - - Attendee notifications - - - - - - - - - - - - - - - - - - - -
+
+class FanoutNotificationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Walk one batch of a conference's attendees."""
+        runFanoutBatch(self.request.get('fanout'),
+                       int(self.request.get('batch')))
+
+
+class SendNotificationsHandler(webapp2.RequestHandler):
+    @idempotent
+    def post(self):
+        """Email a conference update to a batch of attendees."""
+        sendNotifications(self.request.get('fanout'),
+                          self.request.get_all('email'))
+
+# - - - Export - - - - - - - - - - - - - - - - - - - -
+
+class ExportHandler(webapp2.RequestHandler):
+    def get(self, kind):
+        """Stream kind as newline-delimited JSON, resumable by cursor."""
+        if kind not in EXPORT_KINDS:
+            self.abort(404)
+
+        try:
+            lines = exportLines(kind,
+                                cursor=self.request.get('cursor') or None)
+        except datastore_errors.BadValueError:
+            self.abort(400, detail='Invalid cursor.')
+
+        if self.request.get('gzip') in ('1', 'true'):
+            self.response.headers['Content-Type'] = 'application/gzip'
+            self.response.headers['Content-Disposition'] = (
+                'attachment; filename=%s.ndjson.gz' % kind)
+            self.response.app_iter = gzipLines(lines)
+        else:
+            self.response.headers['Content-Type'] = 'application/x-ndjson'
+            self.response.app_iter = lines
+
+# - - - Mapper - - - - - - - - - - - - - - - - - - - -
+
+class RunMapperHandler(webapp2.RequestHandler):
+    def post(self):
+        """Process one batch of a mapper job."""
+        runBatch(int(self.request.get('job')),
+                 int(self.request.get('batch')))
+
+
+class MapperAdminHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report a mapper job's progress as JSON."""
+        job = MapperJob.get_by_id(int(self.request.get('job') or 0))
+        if not job:
+            self.abort(404)
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({
+            'job': job.key.id(),
+            'name': job.name,
+            'dryRun': job.dryRun,
+            'batches': job.batches,
+            'processed': job.processed,
+            'updated': job.updated,
+            'done': job.done,
+        }))
+
+    def post(self):
+        """Start a mapper: name, dry_run, batch_size, delay (seconds)."""
+        try:
+            job = startMapper(
+                self.request.get('name'),
+                dryRun=bool(self.request.get('dry_run')),
+                batchSize=int(self.request.get('batch_size') or 100),
+                delay=int(self.request.get('delay') or 0))
+        except ValueError as e:
+            self.abort(400, detail=str(e))
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({'job': job.key.id()}))
 
 # - - - Set Application - - - - - - - - - - - - - - - - - - - -
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_confirmation_emails', SendConfirmationEmailsHandler),
+    ('/crons/sweep_seat_holds', SweepSeatHoldsHandler),
+    ('/crons/materialize_leaderboards', StartLeaderboardsHandler),
+    ('/crons/build_recommendations', StartRecommendationsHandler),
+    ('/crons/purge_processed_tasks', PurgeProcessedTasksHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
+    ('/tasks/update_autocomplete', UpdateAutocompleteHandler),
+    ('/tasks/index_document', IndexDocumentHandler),
+    ('/tasks/run_mapper', RunMapperHandler),
+    ('/tasks/refresh_cache', RefreshCacheHandler),
+    ('/tasks/fanout_notifications', FanoutNotificationsHandler),
+    ('/tasks/promote_waitlist', PromoteWaitlistHandler),
+    ('/tasks/build_recommendations', BuildRecommendationsHandler),
+    ('/tasks/materialize_leaderboards', MaterializeLeaderboardsHandler),
+    ('/tasks/send_notifications', SendNotificationsHandler),
+    (r'/admin/export/(\w+)', ExportHandler),
+    ('/admin/mapper', MapperAdminHandler),
+    ('/admin/cache_stats', CacheStatsHandler),
+    ('/admin/profiles', ProfilesHandler),
 ], debug=True)
+
+# profiles a sample of requests when PROFILE_SAMPLE_RATE is set
+profileApplication(app)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""
+mapper.py -- Udacity conference server-side Python App Engine
+    resumable batched mapper for backfills & migrations
+
+A mapper is a per-entity function registered for a kind. Running it walks
+the kind with query cursors, one batch per push task; each task writes
+its changes with put_multi, checkpoints the cursor & counts in a
+MapperJob entity and chains the next batch (optionally throttled with a
+countdown). If chaining fails after the checkpoint, the retried task
+only re-enqueues the (deterministically named) next batch. Map functions
+must be idempotent, since a retried batch may see entities it already
+changed.
+"""
+
+import re
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from autocomplete import countedTerm
+from autocomplete import dropShards
+from conference import AUTOCOMPLETE_PLACEHOLDERS
+from models import Conference
+from models import MapperJob
+from models import Profile
+from models import Session
+from popularity import popularityShardsFor
+from tasks import addTask
+from tasks import taskName
+
+MAPPER_BATCH_SIZE = 100
+MAPPER_TASK_URL = '/tasks/run_mapper'
+
+# name -> (model class, function(entity) returning True if the entity
+# changed, or a list of other entities to store instead, function called
+# with the stored entities after each batch or None)
+MAPPERS = {}
+
+
+def registerMapper(name, model, after=None):
+    """Decorator registering function as the mapper called name."""
+    def register(function):
+        MAPPERS[name] = (model, function, after)
+        return function
+    return register
+
+
+def _enqueueBatch(job, batch):
+    """Enqueue batch number batch of job, at most once."""
+    addTask(
+        name=taskName('mapper', job.key.id(), batch),
+        params={'job': job.key.id(), 'batch': batch},
+        url=MAPPER_TASK_URL,
+        countdown=job.delay
+    )
+
+
+def startMapper(name, dryRun=False, batchSize=MAPPER_BATCH_SIZE, delay=0):
+    """Create a MapperJob for the registered mapper & enqueue its first
+    batch; return the job."""
+    if name not in MAPPERS:
+        raise ValueError('Unknown mapper: %s' % name)
+    job = MapperJob(name=name, dryRun=dryRun, batchSize=batchSize,
+                    delay=delay)
+    job.put()
+    _enqueueBatch(job, 0)
+    return job
+
+
+def runBatch(job_id, batch):
+    """Process one batch of a MapperJob and chain the next one."""
+    job = MapperJob.get_by_id(job_id)
+    if not job or job.done:
+        return
+    # batch already checkpointed; chaining the next one may have failed
+    if job.batches == batch + 1:
+        _enqueueBatch(job, job.batches)
+        return
+    # ignore stale or duplicate deliveries of an older batch
+    if job.batches != batch:
+        return
+
+    model, function, after = MAPPERS[job.name]
+    start = Cursor(urlsafe=job.cursor) if job.cursor else None
+    entities, cursor, more = model.query().order(model.key).fetch_page(
+        job.batchSize, start_cursor=start)
+
+    changed, updated = [], 0
+    for entity in entities:
+        result = function(entity)
+        if result is True:
+            changed.append(entity)
+        elif result:
+            changed.extend(result)
+        updated += bool(result)
+    if changed and not job.dryRun:
+        ndb.put_multi(changed)
+        if after:
+            after(changed)
+
+    job.processed += len(entities)
+    job.updated += updated
+    job.batches += 1
+    job.cursor = cursor.urlsafe() if cursor else None
+    job.done = not more
+    job.put()
+
+    if more:
+        _enqueueBatch(job, job.batches)
+
+# - - - Mappers - - - - - - - - - - - - - - - - - - - -
+
+
+@registerMapper('normalize_speakers', Session)
+def normalizeSpeaker(sess):
+    """Collapse repeated/surrounding whitespace in speaker names."""
+    if not sess.speaker:
+        return False
+    speaker = re.sub(r'\s+', ' ', sess.speaker).strip()
+    if speaker == sess.speaker:
+        return False
+    sess.speaker = speaker
+    return True
+
+
+@registerMapper('conference_month', Conference)
+def setConferenceMonth(conf):
+    """Recompute month from startDate."""
+    month = conf.startDate.month if conf.startDate else 0
+    if conf.month == month:
+        return False
+    conf.month = month
+    return True
+
+
+@registerMapper('wishlist_popularity', Session)
+def countWishlists(sess):
+    """Set the session's popularity shards to the number of profiles
+    wishlisting it, counting wishlists made before the counters existed.
+    Wishlist changes made while the mapper runs may be off by one until
+    it runs again."""
+    wssk = sess.key.urlsafe()
+    return popularityShardsFor(wssk, Profile.query(
+        Profile.sessionKeysToWishlist == wssk).count())
+
+
+def _countTerms(model, field, terms):
+    """Return the AutocompleteTerms of field whose counts change when set
+    to the number of model entities spelling the term that way
+    (placeholders count 0)."""
+    changed = []
+    for term in set(terms):
+        if not term:
+            continue
+        count = 0
+        if term not in AUTOCOMPLETE_PLACEHOLDERS.get(field, ()):
+            count = model.query(getattr(model, field) == term).count()
+        entity = countedTerm(field, term, count)
+        if entity:
+            changed.append(entity)
+    return changed
+
+
+@registerMapper('autocomplete_conferences', Conference, after=dropShards)
+def indexConferenceTerms(conf):
+    """Index the conference's city & topics for autocomplete and drop
+    placeholder suggestions."""
+    return (_countTerms(Conference, 'city', [conf.city]) +
+            _countTerms(Conference, 'topics', conf.topics))
+
+
+@registerMapper('autocomplete_speakers', Session, after=dropShards)
+def indexSpeakerTerms(sess):
+    """Index the session's speaker for autocomplete."""
+    return _countTerms(Session, 'speaker', [sess.speaker])
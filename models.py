@@ -78,9 +78,27 @@ class ConferenceForm(messages.Message):
     organizerDisplayName = messages.StringField(12)
 
 
+class ConferenceSummaryForm(messages.Message):
+    """ConferenceSummaryForm -- slim Conference outbound form message"""
+    name = messages.StringField(1)
+    city = messages.StringField(2)
+    startDate = messages.StringField(3)
+    endDate = messages.StringField(4)
+    websafeKey = messages.StringField(5)
+
+
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    summaries = messages.MessageField(ConferenceSummaryForm, 3, repeated=True)
+    missingKeys = messages.StringField(4, repeated=True)
+
+
+class View(messages.Enum):
+    """View -- list endpoint detail level enumeration value"""
+    FULL = 1
+    SUMMARY = 2
 
 
 class TeeShirtSize(messages.Enum):
@@ -113,6 +131,7 @@ class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms --
     multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    view = messages.EnumField('View', 2, default='FULL')
 
 
 class StringMessage(messages.Message):
@@ -144,8 +163,216 @@ class SessionForm(messages.Message):
     startTime = messages.StringField(7)
     websafeConferenceKey = messages.StringField(8)
     websafeSessionKey = messages.StringField(9)
+    wishlisted = messages.BooleanField(10)
+
+
+class SessionSummaryForm(messages.Message):
+    """SessionSummaryForm -- slim Session form message"""
+    name = messages.StringField(1)
+    speaker = messages.StringField(2)
+    date = messages.StringField(3)
+    startTime = messages.StringField(4)
+    websafeConferenceKey = messages.StringField(5)
+    websafeSessionKey = messages.StringField(6)
 
 
 class SessionForms(messages.Message):
     """SessionForms -- multiple Sesssions"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    summaries = messages.MessageField(SessionSummaryForm, 3, repeated=True)
+    missingKeys = messages.StringField(4, repeated=True)
+
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- the current featured speaker (single entity)"""
+    speaker = ndb.StringProperty(indexed=False)
+
+# - - - Seat hold models - - - - - - - - - - - - - - - - -
+
+
+class SeatHold(ndb.Model):
+    """SeatHold -- a seat reserved during checkout (child of Conference)"""
+    userId = ndb.StringProperty()
+    expires = ndb.DateTimeProperty()
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class SeatHoldForm(messages.Message):
+    """SeatHoldForm -- SeatHold outbound form message"""
+    websafeHoldKey = messages.StringField(1)
+    websafeConferenceKey = messages.StringField(2)
+    expires = messages.StringField(3)
+
+
+class SeatAvailabilityForm(messages.Message):
+    """SeatAvailabilityForm -- free & held seats outbound message"""
+    seatsAvailable = messages.IntegerField(1)
+    seatsHeld = messages.IntegerField(2)
+
+# - - - Waitlist models - - - - - - - - - - - - - - - - -
+
+
+class WaitlistEntry(ndb.Model):
+    """WaitlistEntry -- a user queued for a sold out conference
+    (keyed '<websafeConferenceKey>:<userId>', outside the Conference's
+    entity group)"""
+    websafeConferenceKey = ndb.StringProperty()
+    userId = ndb.StringProperty()
+    joined = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class WaitlistForm(messages.Message):
+    """WaitlistForm -- waitlist position outbound message"""
+    websafeConferenceKey = messages.StringField(1)
+    position = messages.IntegerField(2)
+
+
+class SessionConflictForm(messages.Message):
+    """SessionConflictForm -- two overlapping sessions"""
+    first = messages.MessageField(SessionSummaryForm, 1)
+    second = messages.MessageField(SessionSummaryForm, 2)
+
+
+class SessionConflictForms(messages.Message):
+    """SessionConflictForms -- multiple overlapping session pairs"""
+    items = messages.MessageField(SessionConflictForm, 1, repeated=True)
+
+# - - - Popularity models - - - - - - - - - - - - - - - - -
+
+
+class PopularityShard(ndb.Model):
+    """PopularityShard -- one shard of a session's wishlist counter"""
+    websafeSessionKey = ndb.StringProperty(indexed=False)
+    websafeConferenceKey = ndb.StringProperty(indexed=False)
+    count = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class Leaderboard(ndb.Model):
+    """Leaderboard -- materialized most wishlisted sessions
+    (keyed by websafeConferenceKey or 'ALL')"""
+    entries = ndb.JsonProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+class LeaderboardBuild(ndb.Model):
+    """LeaderboardBuild -- progress of a leaderboard materialization;
+    carry is the [websafeSessionKey, websafeConferenceKey, count] of a
+    session whose shards continue in the next batch"""
+    phase = ndb.StringProperty(default='sum')
+    cursor = ndb.StringProperty(indexed=False)
+    carry = ndb.JsonProperty()
+    batches = ndb.IntegerProperty(default=0)
+    done = ndb.BooleanProperty(default=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class LeaderboardPartial(ndb.Model):
+    """LeaderboardPartial -- top sessions of a scope seen so far by a
+    build (keyed like Leaderboard, child of the build)"""
+    entries = ndb.JsonProperty()
+
+
+class SessionPopularityForm(messages.Message):
+    """SessionPopularityForm -- session with its wishlist count"""
+    session = messages.MessageField(SessionSummaryForm, 1)
+    wishlistCount = messages.IntegerField(2)
+
+
+class SessionPopularityForms(messages.Message):
+    """SessionPopularityForms -- most wishlisted sessions"""
+    items = messages.MessageField(SessionPopularityForm, 1, repeated=True)
+
+# - - - Recommendation models - - - - - - - - - - - - - - - - -
+
+
+class RecommendationBuild(ndb.Model):
+    """RecommendationBuild -- progress of a co-occurrence build"""
+    phase = ndb.StringProperty(default='count')
+    cursor = ndb.StringProperty(indexed=False)
+    batches = ndb.IntegerProperty(default=0)
+    done = ndb.BooleanProperty(default=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class CoOccurrence(ndb.Model):
+    """CoOccurrence -- {websafeSessionKey: count} of sessions wishlisted
+    with this one (keyed by websafeSessionKey, child of the build)"""
+    counts = ndb.JsonProperty(compressed=True)
+
+
+class SessionRecommendations(ndb.Model):
+    """SessionRecommendations -- top co-wishlisted sessions
+    [[websafeSessionKey, name, speaker, count], ...]
+    (keyed by websafeSessionKey)"""
+    neighbours = ndb.JsonProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+class SessionRecommendationForm(messages.Message):
+    """SessionRecommendationForm -- a recommended session"""
+    name = messages.StringField(1)
+    speaker = messages.StringField(2)
+    websafeSessionKey = messages.StringField(3)
+    score = messages.IntegerField(4)
+
+
+class SessionRecommendationForms(messages.Message):
+    """SessionRecommendationForms -- multiple recommended sessions"""
+    items = messages.MessageField(SessionRecommendationForm, 1,
+                                  repeated=True)
+
+# - - - Autocomplete models - - - - - - - - - - - - - - - - -
+
+
+class AutocompleteTerm(ndb.Model):
+    """AutocompleteTerm -- a topic, city or speaker with its use count"""
+    field = ndb.StringProperty()
+    term = ndb.StringProperty(indexed=False)
+    prefixes = ndb.StringProperty(repeated=True)
+    count = ndb.IntegerProperty(default=0)
+
+
+class AutocompleteForm(messages.Message):
+    """AutocompleteForm -- outbound autocomplete suggestions message"""
+    items = messages.StringField(1, repeated=True)
+
+
+class NotificationFanout(ndb.Model):
+    """NotificationFanout -- progress of an attendee notification run
+    (child of the updated Conference)"""
+    subject = ndb.StringProperty(indexed=False)
+    body = ndb.TextProperty()
+    cursor = ndb.StringProperty(indexed=False)
+    batches = ndb.IntegerProperty(default=0)
+    recipients = ndb.IntegerProperty(default=0)
+    done = ndb.BooleanProperty(default=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+# - - - Task models - - - - - - - - - - - - - - - - -
+
+
+class ProcessedTask(ndb.Model):
+    """ProcessedTask -- idempotency record of a handled task (by name):
+    claimed by a run until leaseExpires, or done (records written before
+    claims had leases are done)"""
+    done = ndb.BooleanProperty(default=True, indexed=False)
+    leaseExpires = ndb.DateTimeProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+# - - - Mapper models - - - - - - - - - - - - - - - - -
+
+
+class MapperJob(ndb.Model):
+    """MapperJob -- progress checkpoint of a batched mapper run"""
+    name = ndb.StringProperty(required=True)
+    dryRun = ndb.BooleanProperty(default=False)
+    batchSize = ndb.IntegerProperty(default=100)
+    delay = ndb.IntegerProperty(default=0)
+    cursor = ndb.StringProperty(indexed=False)
+    batches = ndb.IntegerProperty(default=0)
+    processed = ndb.IntegerProperty(default=0)
+    updated = ndb.IntegerProperty(default=0)
+    done = ndb.BooleanProperty(default=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+    modified = ndb.DateTimeProperty(auto_now=True)
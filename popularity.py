@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+"""
+popularity.py -- Udacity conference server-side Python App Engine
+    sharded wishlist counters & materialized most-wishlisted leaderboards
+
+Wishlist changes bump one random shard of the session's counter, so
+concurrent writes rarely contend. A cron job starts a build that stores
+the top sessions per conference & overall as Leaderboard entities, cached
+in memcache, so reading a leaderboard is a single lookup. The build runs
+as a chain of push tasks:
+
+  sum   -- walks the shards in key order (a session's shards are
+           adjacent) in cursor batches, and merges each session's total
+           into a LeaderboardPartial per scope (children of the build)
+  write -- walks the build's partials in batches, stores them as
+           Leaderboards & in memcache, then deletes them
+  clean -- deletes the Leaderboards this build did not write (scopes
+           whose sessions are no longer wishlisted) & their memcache
+           entries
+"""
+
+import heapq
+import random
+
+from google.appengine.api import memcache
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Leaderboard
+from models import LeaderboardBuild
+from models import LeaderboardPartial
+from models import PopularityShard
+from tasks import addTask
+from tasks import taskName
+
+POPULARITY_SHARDS = 20
+LEADERBOARD_SIZE = 10
+LEADERBOARD_ALL = 'ALL'
+MEMCACHE_LEADERBOARD_KEY = "LEADERBOARD %s"
+LEADERBOARD_BATCH_SIZE = 500
+LEADERBOARD_URL = '/tasks/materialize_leaderboards'
+
+
+@ndb.transactional(propagation=ndb.TransactionOptions.ALLOWED, xg=True)
+def changePopularity(websafeSessionKey, delta):
+    """Add delta to the session's wishlist count (joins the caller's
+    transaction, if any)."""
+    key = ndb.Key(PopularityShard, '%s:%d' % (
+        websafeSessionKey, random.randint(0, POPULARITY_SHARDS - 1)))
+    shard = key.get()
+    if not shard:
+        shard = PopularityShard(
+            key=key, websafeSessionKey=websafeSessionKey,
+            websafeConferenceKey=ndb.Key(
+                urlsafe=websafeSessionKey).parent().urlsafe())
+    shard.count += delta
+    shard.put()
+
+
+def getPopularity(websafeSessionKey):
+    """Return the session's current wishlist count."""
+    shards = ndb.get_multi([
+        ndb.Key(PopularityShard, '%s:%d' % (websafeSessionKey, i))
+        for i in range(POPULARITY_SHARDS)])
+    return sum(shard.count for shard in shards if shard)
+
+
+def popularityShardsFor(websafeSessionKey, count):
+    """Return the shards to store so the session's wishlist count is
+    count (all of it on the first shard), or [] if it already is."""
+    keys = [ndb.Key(PopularityShard, '%s:%d' % (websafeSessionKey, i))
+            for i in range(POPULARITY_SHARDS)]
+    shards = ndb.get_multi(keys)
+    if sum(shard.count for shard in shards if shard) == count:
+        return []
+    changed = []
+    for i, shard in enumerate(shards):
+        value = count if i == 0 else 0
+        if shard is None:
+            if not value:
+                continue
+            shard = PopularityShard(
+                key=keys[i], websafeSessionKey=websafeSessionKey,
+                websafeConferenceKey=ndb.Key(
+                    urlsafe=websafeSessionKey).parent().urlsafe())
+        if shard.count != value:
+            shard.count = value
+            changed.append(shard)
+    return changed
+
+
+def _enqueue(build, batch):
+    addTask(name=taskName('leaderboard', build.key.id(), build.phase,
+                          batch),
+            params={'build': build.key.id(), 'batch': batch},
+            url=LEADERBOARD_URL)
+
+
+def startLeaderboardBuild():
+    """Create a LeaderboardBuild & enqueue its first batch."""
+    build = LeaderboardBuild()
+    build.put()
+    # the overall board is written even if nothing is wishlisted
+    LeaderboardPartial(id=LEADERBOARD_ALL, parent=build.key,
+                       entries=[]).put()
+    _enqueue(build, 0)
+    return build
+
+
+def _sumBatch(build, start):
+    """Merge the session totals of one batch of shards into the
+    build's partial leaderboards."""
+    shards, cursor, more = PopularityShard.query().order(
+        PopularityShard.key).fetch_page(LEADERBOARD_BATCH_SIZE,
+                                        start_cursor=start)
+
+    totals, conferences = {}, {}
+    if build.carry:
+        wssk, conferences[wssk], totals[wssk] = build.carry
+    for shard in shards:
+        wssk = shard.websafeSessionKey
+        totals[wssk] = totals.get(wssk, 0) + shard.count
+        conferences[wssk] = shard.websafeConferenceKey
+    # the last session's shards may continue in the next batch
+    build.carry = None
+    if more and shards:
+        wssk = shards[-1].websafeSessionKey
+        build.carry = [wssk, conferences[wssk], totals.pop(wssk)]
+
+    by_scope = {}
+    for wssk, count in totals.iteritems():
+        if count > 0:
+            for scope in (conferences[wssk], LEADERBOARD_ALL):
+                by_scope.setdefault(scope, {})[wssk] = count
+    scopes = by_scope.keys()
+    rows = ndb.get_multi([ndb.Key(LeaderboardPartial, scope,
+                                  parent=build.key) for scope in scopes])
+    for i, scope in enumerate(scopes):
+        if rows[i] is None:
+            rows[i] = LeaderboardPartial(id=scope, parent=build.key,
+                                         entries=[])
+        # keyed by session, so a retried batch does not add it twice
+        merged = dict(rows[i].entries)
+        merged.update(by_scope[scope])
+        rows[i].entries = heapq.nlargest(
+            LEADERBOARD_SIZE, ([wssk, n] for wssk, n in merged.iteritems()),
+            key=lambda entry: entry[1])
+    ndb.put_multi(rows)
+    return cursor, more
+
+
+def _writeBatch(build, start):
+    """Store one batch of the build's partials as Leaderboards."""
+    rows, cursor, more = LeaderboardPartial.query(
+        ancestor=build.key
+    ).order(LeaderboardPartial.key).fetch_page(LEADERBOARD_BATCH_SIZE,
+                                               start_cursor=start)
+
+    ndb.put_multi([Leaderboard(id=row.key.id(), entries=row.entries)
+                   for row in rows])
+    memcache.set_multi({MEMCACHE_LEADERBOARD_KEY % row.key.id():
+                        row.entries for row in rows})
+    ndb.delete_multi([row.key for row in rows])
+    return cursor, more
+
+
+def _cleanBatch(build, start):
+    """Delete one batch of Leaderboards older than build."""
+    keys, cursor, more = Leaderboard.query(
+        Leaderboard.updated < build.created
+    ).fetch_page(LEADERBOARD_BATCH_SIZE, start_cursor=start,
+                 keys_only=True)
+    ndb.delete_multi(keys)
+    memcache.delete_multi([MEMCACHE_LEADERBOARD_KEY % key.id()
+                           for key in keys])
+    return cursor, more
+
+
+def runLeaderboardBatch(build_id, batch):
+    """Process one batch of a LeaderboardBuild and chain the next."""
+    build = LeaderboardBuild.get_by_id(build_id)
+    if not build or build.done:
+        return
+    # batch already checkpointed; chaining the next one may have failed
+    if build.batches == batch + 1:
+        _enqueue(build, build.batches)
+        return
+    # ignore stale or duplicate deliveries of an older batch
+    if build.batches != batch:
+        return
+
+    start = Cursor(urlsafe=build.cursor) if build.cursor else None
+    if build.phase == 'sum':
+        cursor, more = _sumBatch(build, start)
+    elif build.phase == 'write':
+        cursor, more = _writeBatch(build, start)
+    else:
+        cursor, more = _cleanBatch(build, start)
+
+    build.batches += 1
+    build.cursor = cursor.urlsafe() if (more and cursor) else None
+    if not more:
+        if build.phase == 'sum':
+            build.phase = 'write'
+        elif build.phase == 'write':
+            build.phase = 'clean'
+        else:
+            build.done = True
+    build.put()
+
+    if not build.done:
+        _enqueue(build, build.batches)
+
+
+def getLeaderboard(scope=LEADERBOARD_ALL):
+    """Return [[websafeSessionKey, count], ...] most wishlisted first for
+    a conference (by websafe key) or LEADERBOARD_ALL."""
+    key = MEMCACHE_LEADERBOARD_KEY % scope
+    entries = memcache.get(key)
+    if entries is None:
+        board = Leaderboard.get_by_id(scope)
+        entries = board.entries if board else []
+        memcache.add(key, entries)
+    return entries
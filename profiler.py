@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+profiler.py -- Udacity conference server-side Python App Engine
+    opt-in sampling cProfile profiler for API methods & handlers
+
+A PROFILE_SAMPLE_RATE fraction of requests (environment variable set in
+app.yaml; 0 turns profiling off) runs under cProfile. The per-function
+stats of each sample are merged into its endpoint's aggregate in
+memcache, trimmed to the functions with the most own & cumulative time,
+so the stats stay bounded however long profiling runs. Aggregates are
+approximate: concurrent samples that lose the compare-and-set race are
+dropped, and trimmed functions start over if they come back.
+"""
+
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import random
+import time
+
+from google.appengine.api import memcache
+
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_CAS_TRIES = 5
+MEMCACHE_PROFILE_KEY = "PROFILE %s"
+MEMCACHE_PROFILED_KEY = "PROFILED ENDPOINTS"
+
+
+def _sampled():
+    """Return True if this request should be profiled."""
+    try:
+        rate = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+    except ValueError:
+        rate = 0
+    return random.random() < rate
+
+
+def _casUpdate(key, update):
+    """Replace the memcache value of key with update(value or None),
+    retrying on concurrent writes; gives up after PROFILE_CAS_TRIES."""
+    client = memcache.Client()
+    for _ in xrange(PROFILE_CAS_TRIES):
+        value = client.gets(key)
+        if value is None:
+            if client.add(key, update(None)):
+                return True
+        elif client.cas(key, update(value)):
+            return True
+    return False
+
+
+def _functionLabel(func):
+    filename, line, name = func
+    return '%s:%d(%s)' % (os.path.basename(filename), line, name)
+
+
+def _record(endpoint, profile, seconds):
+    """Merge one profiled request into endpoint's aggregate."""
+    sample = {}
+    for func, (_, calls, own, cumulative, _) in pstats.Stats(
+            profile).stats.iteritems():
+        sample[_functionLabel(func)] = [calls, own, cumulative]
+
+    def merge(aggregate):
+        aggregate = aggregate or {'samples': 0, 'seconds': 0.0,
+                                  'functions': {}}
+        aggregate['samples'] += 1
+        aggregate['seconds'] += seconds
+        functions = aggregate['functions']
+        for label, (calls, own, cumulative) in sample.iteritems():
+            totals = functions.setdefault(label, [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += own
+            totals[2] += cumulative
+        # keep the top functions by own time & by cumulative time
+        keep = set()
+        for column in (1, 2):
+            keep.update(sorted(functions, key=lambda label: (
+                functions[label][column]), reverse=True)[
+                :PROFILE_TOP_FUNCTIONS])
+        aggregate['functions'] = {label: functions[label]
+                                  for label in keep}
+        return aggregate
+
+    def register(endpoints):
+        endpoints = set(endpoints or [])
+        endpoints.add(endpoint)
+        return sorted(endpoints)
+
+    if _casUpdate(MEMCACHE_PROFILE_KEY % endpoint, merge):
+        _casUpdate(MEMCACHE_PROFILED_KEY, register)
+
+
+def _profile(endpoint, function, *args, **kwargs):
+    """Call function under cProfile & record the stats for endpoint."""
+    profile = cProfile.Profile()
+    start = time.time()
+    try:
+        return profile.runcall(function, *args, **kwargs)
+    finally:
+        try:
+            _record(endpoint, profile, time.time() - start)
+        except Exception:
+            logging.exception('Could not record profile of %s', endpoint)
+
+
+def profiled(endpoint):
+    """Decorator profiling a sample of calls to function as endpoint."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _sampled():
+                return function(*args, **kwargs)
+            return _profile(endpoint, function, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profileService(service):
+    """Profile the remote methods of a ProtoRPC service class (as
+    Service.method); call before the API server is built. The wrappers
+    keep the methods' remote/method_info attributes."""
+    for name, method in service.all_remote_methods().iteritems():
+        setattr(service, name,
+                profiled('%s.%s' % (service.__name__, name))(method))
+
+
+def profileApplication(app):
+    """Profile the handlers of a webapp2 application (as their route
+    template)."""
+    def dispatch(router, request, response):
+        if not _sampled():
+            return router.default_dispatcher(request, response)
+        try:
+            endpoint = router.match(request)[0].template
+        except Exception:
+            endpoint = request.path
+        return _profile(endpoint, router.default_dispatcher,
+                        request, response)
+    app.router.set_dispatcher(dispatch)
+
+
+def getProfiles():
+    """Return {endpoint: {samples, seconds, functions}} where functions
+    lists [label, calls, own seconds, cumulative seconds] by cumulative
+    time, most first."""
+    endpoints = memcache.get(MEMCACHE_PROFILED_KEY) or []
+    aggregates = memcache.get_multi(
+        [MEMCACHE_PROFILE_KEY % endpoint for endpoint in endpoints])
+    profiles = {}
+    for endpoint in endpoints:
+        aggregate = aggregates.get(MEMCACHE_PROFILE_KEY % endpoint)
+        if not aggregate:
+            continue
+        profiles[endpoint] = {
+            'samples': aggregate['samples'],
+            'seconds': aggregate['seconds'],
+            'functions': sorted(
+                ([label] + totals for label, totals in
+                 aggregate['functions'].iteritems()),
+                key=lambda row: row[3], reverse=True),
+        }
+    return profiles
+
+
+def clearProfiles():
+    """Drop all collected profiles."""
+    endpoints = memcache.get(MEMCACHE_PROFILED_KEY) or []
+    memcache.delete_multi([MEMCACHE_PROFILE_KEY % endpoint
+                           for endpoint in endpoints] +
+                          [MEMCACHE_PROFILED_KEY])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+queryplan.py -- Udacity conference server-side Python App Engine
+    query planner for queryConferences filters
+
+Serving every combination of queryConferences filters from the Datastore
+takes a composite index per combination, and each one is written on
+every Conference put. Instead, a plan lets one property lead the query:
+
+  - the inequality field, if there is one (all its inequality filters);
+  - otherwise the equality filter on the most selective field.
+
+That part is served by a (field, name) index, and the remaining filters
+(always equalities) are evaluated in memory over the already ordered
+results. This needs one composite index per filterable field, plus one
+per field for SUMMARY views of queries it serves entirely, which are
+projected. index_footprint.py reports the indexes & their write cost.
+
+Plain Python (no App Engine imports), so tools can use it.
+"""
+
+import collections
+
+# filterable Conference properties (conference.FIELDS), most selective
+# first; picks the equality filter that leads a query
+PLAN_FIELD_RANK = ('city', 'topics', 'startDate', 'endDate', 'month',
+                   'maxAttendees')
+# results are always ordered by name (after the inequality field)
+PLAN_SORT = 'name'
+# properties of SUMMARY views (conference.CONF_SUMMARY_FIELDS)
+PLAN_SUMMARY_FIELDS = ('name', 'city', 'startDate', 'endDate')
+
+QueryPlan = collections.namedtuple('QueryPlan',
+                                   'served remainder order index')
+
+
+def _rank(field):
+    if field in PLAN_FIELD_RANK:
+        return PLAN_FIELD_RANK.index(field)
+    return len(PLAN_FIELD_RANK)
+
+
+def planConferenceQuery(inequality_field, filters):
+    """Split filters ({field, operator, value} dicts, as formatted by
+    ConferenceApi._formatFilters) into the part served by an index and
+    the rest.
+
+    Returns a QueryPlan of the served & remaining filters, the sort
+    order, and the composite index the served part needs (a tuple of
+    property names; None if only built-in indexes are used).
+    """
+    if inequality_field:
+        lead = inequality_field
+        served = [f for f in filters
+                  if f['field'] == lead and f['operator'] != '=']
+    elif filters:
+        served = [min(filters, key=lambda f: _rank(f['field']))]
+        lead = served[0]['field']
+    else:
+        lead, served = None, []
+
+    remainder = [f for f in filters
+                 if not any(f is s for s in served)]
+    if inequality_field:
+        order = (lead, PLAN_SORT)
+    else:
+        order = (PLAN_SORT,)
+    index = (lead, PLAN_SORT) if lead else None
+    return QueryPlan(served, remainder, order, index)
+
+
+def projectedIndex(plan, projection):
+    """Return the composite index a projection query of the served part
+    of plan needs: plan.index followed by the other projected properties
+    in name order (None if only built-in indexes are used)."""
+    if not plan.index:
+        return None
+    return plan.index + tuple(sorted(set(projection) - set(plan.index)))
+
+
+def matchesFilters(entity, filters):
+    """Return True if entity passes every equality filter; repeated
+    properties match on any of their values, as in the Datastore."""
+    for filtr in filters:
+        value = getattr(entity, filtr['field'], None)
+        values = value if isinstance(value, list) else [value]
+        if filtr['value'] not in values:
+            return False
+    return True
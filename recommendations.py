@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+recommendations.py -- Udacity conference server-side Python App Engine
+    "people who wishlisted this also wishlisted" session recommendations
+
+An offline build, started by cron, runs as a chain of push tasks:
+
+  count -- walks Profiles in cursor batches and adds every pair of
+           sessions wishlisted together to a sparse co-occurrence table
+           (one CoOccurrence row per session, children of the build so
+           the rank phase reads them strongly consistently)
+  rank  -- walks the build's rows in batches and keeps the top
+           RECOMMENDATION_TOP_K neighbours of each session in a compact
+           SessionRecommendations entity, then deletes the rows
+  clean -- deletes the SessionRecommendations this build did not write
+           (sessions no longer wishlisted together with any other)
+
+so serving recommendations for a session is a single get. Counts are
+approximate: a count batch retried after its rows were written counts its
+profiles twice.
+"""
+
+import heapq
+import itertools
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import CoOccurrence
+from models import Profile
+from models import RecommendationBuild
+from models import SessionRecommendations
+from tasks import addTask
+from tasks import taskName
+
+RECOMMENDATION_BATCH_SIZE = 100
+RECOMMENDATION_TOP_K = 5
+# wishlists are capped so one profile adds at most ~MAX^2/2 pairs
+RECOMMENDATION_MAX_WISHLIST = 50
+RECOMMENDATION_URL = '/tasks/build_recommendations'
+
+
+def _enqueue(build, batch):
+    addTask(name=taskName('recommend', build.key.id(), build.phase, batch),
+            params={'build': build.key.id(), 'batch': batch},
+            url=RECOMMENDATION_URL)
+
+
+def startBuild():
+    """Create a RecommendationBuild & enqueue its first batch."""
+    build = RecommendationBuild()
+    build.put()
+    _enqueue(build, 0)
+    return build
+
+
+def _countBatch(build, start):
+    """Add the co-occurrences of one batch of Profiles to the table."""
+    profiles, cursor, more = Profile.query().order(Profile.key).fetch_page(
+        RECOMMENDATION_BATCH_SIZE, start_cursor=start)
+
+    pairs = {}
+    for prof in profiles:
+        wishlist = sorted(set(prof.sessionKeysToWishlist))
+        for a, b in itertools.combinations(
+                wishlist[:RECOMMENDATION_MAX_WISHLIST], 2):
+            for this, other in ((a, b), (b, a)):
+                counts = pairs.setdefault(this, {})
+                counts[other] = counts.get(other, 0) + 1
+
+    wssks = pairs.keys()
+    rows = ndb.get_multi([ndb.Key(CoOccurrence, wssk, parent=build.key)
+                          for wssk in wssks])
+    for i, wssk in enumerate(wssks):
+        if rows[i] is None:
+            rows[i] = CoOccurrence(id=wssk, parent=build.key, counts={})
+        counts = rows[i].counts
+        for other, n in pairs[wssk].iteritems():
+            counts[other] = counts.get(other, 0) + n
+    ndb.put_multi(rows)
+    return cursor, more
+
+
+def _rankBatch(build, start):
+    """Store the top neighbours of one batch of co-occurrence rows."""
+    rows, cursor, more = CoOccurrence.query(
+        ancestor=build.key
+    ).order(CoOccurrence.key).fetch_page(RECOMMENDATION_BATCH_SIZE,
+                                         start_cursor=start)
+
+    tops = [heapq.nlargest(RECOMMENDATION_TOP_K, row.counts.iteritems(),
+                           key=lambda item: item[1])
+            for row in rows]
+    # denormalize what the session page shows, so serving is one get
+    neighbours = ndb.get_multi(list(set(
+        ndb.Key(urlsafe=wssk) for top in tops for wssk, _ in top)))
+    names = {sess.key.urlsafe(): (sess.name, sess.speaker)
+             for sess in neighbours if sess}
+
+    ndb.put_multi([
+        SessionRecommendations(
+            id=row.key.id(),
+            neighbours=[[wssk, names[wssk][0], names[wssk][1], n]
+                        for wssk, n in top if wssk in names])
+        for row, top in zip(rows, tops)])
+    ndb.delete_multi([row.key for row in rows])
+    return cursor, more
+
+
+def _cleanBatch(build, start):
+    """Delete one batch of SessionRecommendations older than build."""
+    keys, cursor, more = SessionRecommendations.query(
+        SessionRecommendations.updated < build.created
+    ).fetch_page(RECOMMENDATION_BATCH_SIZE, start_cursor=start,
+                 keys_only=True)
+    ndb.delete_multi(keys)
+    return cursor, more
+
+
+def runBuildBatch(build_id, batch):
+    """Process one batch of a RecommendationBuild and chain the next."""
+    build = RecommendationBuild.get_by_id(build_id)
+    if not build or build.done:
+        return
+    # batch already checkpointed; chaining the next one may have failed
+    if build.batches == batch + 1:
+        _enqueue(build, build.batches)
+        return
+    # ignore stale or duplicate deliveries of an older batch
+    if build.batches != batch:
+        return
+
+    start = Cursor(urlsafe=build.cursor) if build.cursor else None
+    if build.phase == 'count':
+        cursor, more = _countBatch(build, start)
+    elif build.phase == 'rank':
+        cursor, more = _rankBatch(build, start)
+    else:
+        cursor, more = _cleanBatch(build, start)
+
+    build.batches += 1
+    build.cursor = cursor.urlsafe() if (more and cursor) else None
+    if not more:
+        if build.phase == 'count':
+            build.phase = 'rank'
+        elif build.phase == 'rank':
+            build.phase = 'clean'
+        else:
+            build.done = True
+    build.put()
+
+    if not build.done:
+        _enqueue(build, build.batches)
@@ -0,0 +1,723 @@
+#!/usr/bin/env python
+
+"""
+repository.py -- Udacity conference server-side Python App Engine
+    storage backends for Profile, Conference & Session
+
+ConferenceApi reads & writes its entities (profiles, conferences,
+sessions, seat holds & waitlist entries) through a repository, so the
+same endpoint code can run against either of:
+
+  NdbRepository    -- the Datastore, through ndb (what the app serves from)
+  MemoryRepository -- dicts plus sorted secondary indexes with emulated
+                      transactions; no Datastore or task queue RPCs, for
+                      fast tests & benchmarks of endpoint scenarios
+
+Both hand out ordinary ndb model instances & keys. Paged queries take
+and return opaque cursor strings; a malformed one raises
+datastore_errors.BadValueError. The side effects of these operations
+(push tasks, confirmation emails, notification fan-outs, wishlist
+counts) go through the repository too: MemoryRepository appends them to
+its outbox (on commit, inside a transaction) instead of calling the
+services, and serves leaderboards from the wishlist counts it recorded.
+Only the per-instance conference cache still needs memcache
+(bench_scenarios.py uses the in-process memcache stub).
+"""
+
+import bisect
+import copy
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+
+from google.appengine.api import datastore_errors
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from fanout import startFanout as recordFanout
+from mailer import queueConfirmationEmail as queueEmail
+from models import Conference
+from models import SeatHold
+from models import Session
+from models import WaitlistEntry
+from popularity import LEADERBOARD_ALL
+from popularity import LEADERBOARD_SIZE
+from popularity import changePopularity as recordPopularity
+from popularity import getLeaderboard
+from queryplan import matchesFilters
+from queryplan import planConferenceQuery
+from tasks import addTask as enqueueTask
+
+# a cross-group transaction may touch at most this many entity groups
+MAX_XG_GROUPS = 25
+# batch size of queries whose results are filtered further in memory
+QUERY_BATCH_SIZE = 200
+
+
+def _cursor(urlsafe):
+    """Return the Cursor for a websafe cursor string (None if empty)."""
+    if not urlsafe:
+        return None
+    try:
+        return Cursor(urlsafe=urlsafe)
+    except Exception:
+        raise datastore_errors.BadValueError(
+            'Invalid cursor: %s' % urlsafe)
+
+
+class NdbRepository(object):
+    """Profile/Conference/Session storage in the Datastore."""
+
+    def get(self, key):
+        """Return the entity for key, or None."""
+        return key.get()
+
+    def getMulti(self, keys):
+        """Return the entities for keys (None where missing), in order."""
+        return ndb.get_multi(keys)
+
+    def put(self, entity):
+        """Store entity; return its key."""
+        return entity.put()
+
+    def putMulti(self, entities):
+        """Store entities; return their keys."""
+        return ndb.put_multi(entities)
+
+    def delete(self, key):
+        """Delete the entity for key (if any)."""
+        key.delete()
+
+    def deleteMulti(self, keys):
+        """Delete the entities for keys (where they exist)."""
+        ndb.delete_multi(keys)
+
+    def allocateKey(self, model, parent=None):
+        """Return a new, unused key of model under parent."""
+        return ndb.Key(model, model.allocate_ids(size=1, parent=parent)[0],
+                       parent=parent)
+
+    def transaction(self, function, xg=False):
+        """Run function in a transaction; return its result."""
+        return ndb.transaction(function, xg=xg)
+
+    @staticmethod
+    def _fetch(q, projection=None):
+        """Run q, as a projection query if projection is given.
+
+        Callers only project query shapes index.yaml covers; a missing
+        index is logged and answered with full entities.
+        """
+        if not projection:
+            return q.fetch()
+        try:
+            return q.fetch(projection=projection)
+        except datastore_errors.NeedIndexError:
+            logging.exception('No index for projection %s', projection)
+            return q.fetch()
+
+    def conferencesByOrganizer(self, p_key, projection=None):
+        """Return the conferences created by the Profile p_key."""
+        return self._fetch(Conference.query(ancestor=p_key), projection)
+
+    def queryConferences(self, inequality_field, filters, projection=None):
+        """Return conferences matching filters ({field, operator, value}
+        dicts), ordered by the inequality field (if any), then name.
+
+        Only the filters of the leading property go to the Datastore (see
+        queryplan.py); the rest are checked on the results. Queries the
+        index serves entirely are projected (index.yaml has a projection
+        index per leading property, see queryplan.projectedIndex).
+        """
+        plan = planConferenceQuery(inequality_field, filters)
+        q = Conference.query()
+        for prop in plan.order:
+            q = q.order(ndb.GenericProperty(prop))
+        for filtr in plan.served:
+            q = q.filter(ndb.query.FilterNode(
+                filtr["field"], filtr["operator"], filtr["value"]))
+
+        if not plan.remainder:
+            return self._fetch(q, projection)
+        # remaining filters need unprojected entities
+        return [conf for conf in q.iter(batch_size=QUERY_BATCH_SIZE)
+                if matchesFilters(conf, plan.remainder)]
+
+    def conferencesStartingBetween(self, first, last, limit, cursor=None):
+        """Return a page of up to limit conferences starting on or after
+        first (and on or before last, unless None) by start date, as
+        (conferences, cursor of the next page or None)."""
+        q = Conference.query(Conference.startDate >= first)
+        if last is not None:
+            q = q.filter(Conference.startDate <= last)
+        # both inequalities are on startDate, so the query is served by
+        # the built-in single property index
+        confs, next_cursor, more = q.order(Conference.startDate).fetch_page(
+            limit, start_cursor=_cursor(cursor))
+        token = next_cursor.urlsafe() if (more and next_cursor) else None
+        return confs, token
+
+    def conferencesNearlySoldOut(self, seats, projection=None):
+        """Return the conferences with 1 to seats seats available."""
+        return self._fetch(Conference.query(
+            Conference.seatsAvailable <= seats,
+            Conference.seatsAvailable > 0), projection)
+
+    def sessionsOfConference(self, c_key, typeOfSession=None,
+                             projection=None):
+        """Return the sessions of the Conference c_key, optionally only
+        those of a type."""
+        q = Session.query(ancestor=c_key)
+        if typeOfSession is not None:
+            q = q.filter(Session.typeOfSession == typeOfSession)
+        return self._fetch(q, projection)
+
+    def sessionsBySpeaker(self, speaker, c_key=None, projection=None):
+        """Return the sessions given by speaker, across all conferences
+        or only those of the Conference c_key."""
+        q = Session.query(Session.speaker == speaker, ancestor=c_key)
+        return self._fetch(q, projection)
+
+    def sessionsBefore(self, date):
+        """Return the sessions held before date."""
+        return Session.query(Session.date < date).fetch()
+
+    def allSessions(self):
+        """Return every session."""
+        return Session.query().fetch()
+
+    def hasSessionBySpeaker(self, speaker, c_key):
+        """Return True if the Conference c_key has a session by speaker."""
+        return Session.query(Session.speaker == speaker,
+                             ancestor=c_key).get(keys_only=True) is not None
+
+    def sessionTimelines(self, starts, limit):
+        """Return {c_key: [(session, cursor after it), ...]} with up to
+        limit sessions of each conference in starts ({c_key: cursor or
+        None}) by date & startTime, resuming at cursor. The queries
+        run in parallel."""
+        iterators = {}
+        for c_key, cursor in starts.iteritems():
+            q = Session.query(ancestor=c_key).order(Session.date,
+                                                    Session.startTime)
+            iterators[c_key] = q.iter(
+                limit=limit, batch_size=limit, produce_cursors=True,
+                start_cursor=_cursor(cursor))
+        for iterator in iterators.itervalues():
+            iterator.has_next_async()
+        return {c_key: [(sess, iterator.cursor_after().urlsafe())
+                        for sess in iterator]
+                for c_key, iterator in iterators.iteritems()}
+
+    def liveHolds(self, c_key):
+        """Return the unexpired seat holds on a conference."""
+        return SeatHold.query(SeatHold.expires > datetime.datetime.now(),
+                              ancestor=c_key).fetch()
+
+    def liveHoldCount(self, c_key):
+        """Return the number of unexpired seat holds on a conference."""
+        return SeatHold.query(
+            SeatHold.expires > datetime.datetime.now(),
+            ancestor=c_key).count()
+
+    def expiredHoldKeys(self, now, limit, cursor=None):
+        """Return a page of up to limit keys of seat holds expired at
+        now, as (keys, cursor of the next page or None)."""
+        keys, next_cursor, more = SeatHold.query(
+            SeatHold.expires <= now).fetch_page(
+                limit, start_cursor=_cursor(cursor), keys_only=True)
+        token = next_cursor.urlsafe() if (more and next_cursor) else None
+        return keys, token
+
+    def waitlist(self, wsck, limit):
+        """Return the first limit entries of a conference's waitlist,
+        in the order they joined."""
+        return WaitlistEntry.query(
+            WaitlistEntry.websafeConferenceKey == wsck
+        ).order(WaitlistEntry.joined).fetch(limit)
+
+    def waitlistPosition(self, entry):
+        """Return entry's 1-based place on its conference's waitlist."""
+        return WaitlistEntry.query(
+            WaitlistEntry.websafeConferenceKey == entry.websafeConferenceKey,
+            WaitlistEntry.joined < entry.joined).count() + 1
+
+    def changePopularity(self, websafeSessionKey, delta):
+        """Add delta to a session's wishlist count, in the caller's
+        transaction (see popularity.py)."""
+        recordPopularity(websafeSessionKey, delta)
+
+    def leaderboard(self, scope=LEADERBOARD_ALL):
+        """Return [[websafeSessionKey, count], ...] most wishlisted first
+        (see popularity.getLeaderboard)."""
+        return getLeaderboard(scope)
+
+    def addTask(self, url, **kwargs):
+        """Enqueue a push task (see tasks.addTask)."""
+        return enqueueTask(url, **kwargs)
+
+    def queueConfirmationEmail(self, email, conf, transactional=False):
+        """Queue a creation confirmation email (see mailer.py)."""
+        queueEmail(email, conf, transactional=transactional)
+
+    def startFanout(self, conf, changes):
+        """Notify conf's attendees of changes; must run inside the
+        transaction updating conf (see fanout.py)."""
+        recordFanout(conf, changes)
+
+
+def _detach(entity):
+    """Return a copy of entity sharing no mutable state with it, as if it
+    had been written & read back."""
+    return entity.__class__(key=entity.key,
+                            **copy.deepcopy(entity.to_dict()))
+
+
+def _indexValues(entity, prop):
+    """Return the distinct values entity is indexed under for prop."""
+    value = getattr(entity, prop, None)
+    if isinstance(value, list):
+        return set(value)
+    return [value]
+
+
+def _offset(cursor):
+    """Return the result offset a MemoryRepository cursor stands for."""
+    try:
+        return int(cursor or 0)
+    except ValueError:
+        raise datastore_errors.BadValueError('Invalid cursor: %s' % cursor)
+
+
+def _page(entities, limit, cursor):
+    """Return (up to limit entities from cursor on, cursor of the next
+    page or None)."""
+    start = _offset(cursor)
+    page = entities[start:start + limit]
+    end = start + len(page)
+    return page, str(end) if end < len(entities) else None
+
+
+def _sortValue(entity, prop):
+    """Return the value entity sorts by for prop (ascending); repeated
+    properties sort by their smallest value, like the Datastore."""
+    value = getattr(entity, prop, None)
+    if isinstance(value, list):
+        return min(value) if value else None
+    return value
+
+
+class _SortedIndex(object):
+    """Entries (value, key path, key) of one property, kept sorted, with
+    the values in a parallel list for range bisection."""
+
+    def __init__(self):
+        self._values = []
+        self._entries = []
+
+    def add(self, value, key):
+        entry = (value, key.pairs(), key)
+        i = bisect.bisect_left(self._entries, entry)
+        self._entries.insert(i, entry)
+        self._values.insert(i, value)
+
+    def remove(self, value, key):
+        i = bisect.bisect_left(self._entries, (value, key.pairs()))
+        if i < len(self._entries) and self._entries[i][2] == key:
+            del self._entries[i]
+            del self._values[i]
+
+    def scan(self, operator, value):
+        """Return the set of keys with an entry satisfying operator."""
+        n = len(self._values)
+        if operator == '=':
+            ranges = [(bisect.bisect_left(self._values, value),
+                       bisect.bisect_right(self._values, value))]
+        elif operator == '>':
+            ranges = [(bisect.bisect_right(self._values, value), n)]
+        elif operator == '>=':
+            ranges = [(bisect.bisect_left(self._values, value), n)]
+        elif operator == '<':
+            ranges = [(0, bisect.bisect_left(self._values, value))]
+        elif operator == '<=':
+            ranges = [(0, bisect.bisect_right(self._values, value))]
+        elif operator == '!=':
+            ranges = [(0, bisect.bisect_left(self._values, value)),
+                      (bisect.bisect_right(self._values, value), n)]
+        else:
+            raise datastore_errors.BadArgumentError(
+                'Unsupported filter operator: %s' % operator)
+        return set(self._entries[i][2]
+                   for start, end in ranges for i in xrange(start, end))
+
+
+class _Transaction(object):
+    """Writes (None for deletes) & side effects buffered, and entity
+    groups touched, by a transaction."""
+
+    def __init__(self, xg):
+        self.xg = xg
+        self.writes = {}
+        self.effects = []
+        self.groups = set()
+
+    def touch(self, key):
+        self.groups.add(key.root())
+        if not self.xg and len(self.groups) > 1:
+            raise datastore_errors.BadRequestError(
+                'cross-group transactions need to be explicitly '
+                'specified (xg=True)')
+        if len(self.groups) > MAX_XG_GROUPS:
+            raise datastore_errors.BadRequestError(
+                'operating on too many entity groups in a single '
+                'transaction.')
+
+
+class MemoryRepository(object):
+    """Profile/Conference/Session storage in process memory.
+
+    Entities are stored as detached copies, keyed by ndb key, with an
+    ancestor index & a sorted index per filterable property, so queries
+    are answered by intersecting index scans. Transactions hold a
+    (reentrant) lock, buffer their writes & side effects and apply them
+    on success, and enforce the Datastore's entity group limits.
+
+    Side effects are appended to outbox as ('task', kwargs),
+    ('email', email, conf), ('fanout', conference key, changes) or
+    ('popularity', websafeSessionKey, delta); named tasks are enqueued
+    at most once, like the task queue does. Cursors are result offsets.
+    """
+
+    # properties queries filter on, per kind
+    INDEXED = {
+        'Conference': ('name', 'city', 'topics', 'month', 'maxAttendees',
+                       'startDate', 'endDate', 'seatsAvailable'),
+        'Session': ('speaker', 'typeOfSession', 'date'),
+        'SeatHold': ('expires',),
+        'WaitlistEntry': ('websafeConferenceKey', 'joined'),
+    }
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._txn = None
+        self._taskNames = set()
+        self._popularity = {}
+        self.outbox = []
+        self._entities = {}
+        self._kinds = {}
+        self._children = {}
+        self._indexes = {}
+
+    def _index(self, kind, prop):
+        index = self._indexes.get((kind, prop))
+        if index is None:
+            index = self._indexes[(kind, prop)] = _SortedIndex()
+        return index
+
+    def _ancestors(self, key):
+        parent = key.parent()
+        while parent is not None:
+            yield parent
+            parent = parent.parent()
+
+    def _store(self, entity):
+        """Write entity & update the indexes (outside transactions)."""
+        key, kind = entity.key, entity.key.kind()
+        old = self._entities.get(key)
+        for prop in self.INDEXED.get(kind, ()):
+            index = self._index(kind, prop)
+            if old is not None:
+                for value in _indexValues(old, prop):
+                    index.remove(value, key)
+            for value in _indexValues(entity, prop):
+                index.add(value, key)
+        if old is None:
+            self._kinds.setdefault(kind, set()).add(key)
+            for ancestor in self._ancestors(key):
+                self._children.setdefault(ancestor, set()).add(key)
+        self._entities[key] = entity
+
+    def _remove(self, key):
+        """Delete key's entity & its index entries (outside
+        transactions)."""
+        old = self._entities.pop(key, None)
+        if old is None:
+            return
+        kind = key.kind()
+        for prop in self.INDEXED.get(kind, ()):
+            for value in _indexValues(old, prop):
+                self._index(kind, prop).remove(value, key)
+        self._kinds[kind].discard(key)
+        for ancestor in self._ancestors(key):
+            self._children[ancestor].discard(key)
+
+    def get(self, key):
+        """Return the entity for key, or None."""
+        return self.getMulti([key])[0]
+
+    def getMulti(self, keys):
+        """Return the entities for keys (None where missing), in order."""
+        with self._lock:
+            entities = []
+            for key in keys:
+                if self._txn is not None and key in self._txn.writes:
+                    entity = self._txn.writes[key]
+                else:
+                    if self._txn is not None:
+                        self._txn.touch(key)
+                    entity = self._entities.get(key)
+                entities.append(entity and _detach(entity))
+            return entities
+
+    def put(self, entity):
+        """Store entity; return its key."""
+        with self._lock:
+            if entity.key is None:
+                entity.key = self.allocateKey(entity.__class__)
+            # set auto_now(_add) properties, as ndb does on put
+            entity._prepare_for_put()
+            if self._txn is not None:
+                self._txn.touch(entity.key)
+                self._txn.writes[entity.key] = _detach(entity)
+            else:
+                self._store(_detach(entity))
+            return entity.key
+
+    def putMulti(self, entities):
+        """Store entities; return their keys."""
+        return [self.put(entity) for entity in entities]
+
+    def delete(self, key):
+        """Delete the entity for key (if any)."""
+        self.deleteMulti([key])
+
+    def deleteMulti(self, keys):
+        """Delete the entities for keys (where they exist)."""
+        with self._lock:
+            for key in keys:
+                if self._txn is not None:
+                    self._txn.touch(key)
+                    self._txn.writes[key] = None
+                else:
+                    self._remove(key)
+
+    def allocateKey(self, model, parent=None):
+        """Return a new, unused key of model under parent."""
+        return ndb.Key(model, next(self._ids), parent=parent)
+
+    def transaction(self, function, xg=False):
+        """Run function in an emulated transaction; return its result.
+        Its writes are applied only if it returns without raising."""
+        with self._lock:
+            if self._txn is not None:
+                raise datastore_errors.BadRequestError(
+                    'Nested transactions are not supported.')
+            self._txn = _Transaction(xg)
+            try:
+                result = function()
+                txn = self._txn
+            finally:
+                self._txn = None
+            for key, entity in txn.writes.iteritems():
+                if entity is None:
+                    self._remove(key)
+                else:
+                    self._store(entity)
+            for effect in txn.effects:
+                self._apply(effect)
+            return result
+
+    def _apply(self, effect):
+        """Record a side effect in the outbox (& wishlist counts)."""
+        self.outbox.append(effect)
+        if effect[0] == 'popularity':
+            _, wssk, delta = effect
+            self._popularity[wssk] = self._popularity.get(wssk, 0) + delta
+
+    def _emit(self, effect):
+        """Record a side effect; inside a transaction, on commit."""
+        if self._txn is not None:
+            self._txn.effects.append(effect)
+        else:
+            self._apply(effect)
+
+    def _query(self, kind, filters=(), ancestor=None, order=()):
+        """Return detached entities of kind under ancestor whose indexed
+        properties satisfy every (prop, operator, value) filter, sorted
+        by the order properties and then by key."""
+        with self._lock:
+            if ancestor is not None:
+                keys = set(key for key in self._children.get(ancestor, ())
+                           if key.kind() == kind)
+            else:
+                keys = set(self._kinds.get(kind, ()))
+            # narrowest index scans first, so intersections stay small
+            scans = sorted((self._index(kind, prop).scan(operator, value)
+                            for prop, operator, value in filters), key=len)
+            for matches in scans:
+                keys &= matches
+            entities = [self._entities[key] for key in keys]
+
+        entities.sort(key=lambda entity: tuple(
+            _sortValue(entity, prop) for prop in order) + (
+            entity.key.pairs(),))
+        return [_detach(entity) for entity in entities]
+
+    def conferencesByOrganizer(self, p_key, projection=None):
+        """Return the conferences created by the Profile p_key."""
+        return self._query('Conference', ancestor=p_key)
+
+    def queryConferences(self, inequality_field, filters, projection=None):
+        """Return conferences matching filters ({field, operator, value}
+        dicts), ordered by the inequality field (if any), then name."""
+        order = ('name',)
+        if inequality_field:
+            order = (inequality_field,) + order
+        return self._query(
+            'Conference',
+            [(f["field"], f["operator"], f["value"]) for f in filters],
+            order=order)
+
+    def conferencesStartingBetween(self, first, last, limit, cursor=None):
+        """Return a page of up to limit conferences starting on or after
+        first (and on or before last, unless None) by start date, as
+        (conferences, cursor of the next page or None)."""
+        filters = [('startDate', '>=', first)]
+        if last is not None:
+            filters.append(('startDate', '<=', last))
+        return _page(self._query('Conference', filters,
+                                 order=('startDate',)), limit, cursor)
+
+    def conferencesNearlySoldOut(self, seats, projection=None):
+        """Return the conferences with 1 to seats seats available."""
+        return self._query('Conference', [('seatsAvailable', '<=', seats),
+                                          ('seatsAvailable', '>', 0)])
+
+    def sessionsOfConference(self, c_key, typeOfSession=None,
+                             projection=None):
+        """Return the sessions of the Conference c_key, optionally only
+        those of a type."""
+        filters = []
+        if typeOfSession is not None:
+            filters.append(('typeOfSession', '=', typeOfSession))
+        return self._query('Session', filters, ancestor=c_key)
+
+    def sessionsBySpeaker(self, speaker, c_key=None, projection=None):
+        """Return the sessions given by speaker, across all conferences
+        or only those of the Conference c_key."""
+        return self._query('Session', [('speaker', '=', speaker)],
+                           ancestor=c_key)
+
+    def sessionsBefore(self, date):
+        """Return the sessions held before date."""
+        return self._query('Session', [('date', '<', date)],
+                           order=('date',))
+
+    def allSessions(self):
+        """Return every session."""
+        return self._query('Session')
+
+    def hasSessionBySpeaker(self, speaker, c_key):
+        """Return True if the Conference c_key has a session by speaker."""
+        return bool(self._query('Session', [('speaker', '=', speaker)],
+                                ancestor=c_key))
+
+    def sessionTimelines(self, starts, limit):
+        """Return {c_key: [(session, cursor after it), ...]} with up to
+        limit sessions of each conference in starts ({c_key: cursor or
+        None}) by date & startTime, resuming at cursor."""
+        pages = {}
+        for c_key, cursor in starts.iteritems():
+            start = _offset(cursor)
+            sessions = self._query('Session', ancestor=c_key,
+                                   order=('date', 'startTime'))
+            pages[c_key] = [(sess, str(start + i + 1)) for i, sess in
+                            enumerate(sessions[start:start + limit])]
+        return pages
+
+    def liveHolds(self, c_key):
+        """Return the unexpired seat holds on a conference."""
+        return self._query(
+            'SeatHold', [('expires', '>', datetime.datetime.now())],
+            ancestor=c_key)
+
+    def liveHoldCount(self, c_key):
+        """Return the number of unexpired seat holds on a conference."""
+        return len(self.liveHolds(c_key))
+
+    def expiredHoldKeys(self, now, limit, cursor=None):
+        """Return a page of up to limit keys of seat holds expired at
+        now, as (keys, cursor of the next page or None)."""
+        holds, token = _page(self._query('SeatHold',
+                                         [('expires', '<=', now)]),
+                             limit, cursor)
+        return [hold.key for hold in holds], token
+
+    def waitlist(self, wsck, limit):
+        """Return the first limit entries of a conference's waitlist,
+        in the order they joined."""
+        return self._query('WaitlistEntry',
+                           [('websafeConferenceKey', '=', wsck)],
+                           order=('joined',))[:limit]
+
+    def waitlistPosition(self, entry):
+        """Return entry's 1-based place on its conference's waitlist."""
+        return len(self._query(
+            'WaitlistEntry',
+            [('websafeConferenceKey', '=', entry.websafeConferenceKey),
+             ('joined', '<', entry.joined)])) + 1
+
+    def changePopularity(self, websafeSessionKey, delta):
+        """Record a change of a session's wishlist count (applied to the
+        counts on commit)."""
+        with self._lock:
+            self._emit(('popularity', websafeSessionKey, delta))
+
+    def leaderboard(self, scope=LEADERBOARD_ALL):
+        """Return [[websafeSessionKey, count], ...] most wishlisted first,
+        from the recorded wishlist counts."""
+        with self._lock:
+            entries = [[wssk, count]
+                       for wssk, count in self._popularity.iteritems()
+                       if count > 0 and (
+                           scope == LEADERBOARD_ALL or
+                           ndb.Key(urlsafe=wssk).parent().urlsafe() == scope)]
+        return heapq.nlargest(LEADERBOARD_SIZE, entries,
+                              key=lambda entry: entry[1])
+
+    def addTask(self, url, name=None, transactional=False, **kwargs):
+        """Record a push task; return False if a task of that name was
+        already recorded."""
+        with self._lock:
+            if transactional and self._txn is None:
+                raise datastore_errors.BadRequestError(
+                    'Transactional tasks can only be added in a '
+                    'transaction.')
+            if name is not None:
+                if name in self._taskNames:
+                    return False
+                self._taskNames.add(name)
+            kwargs.update(url=url, name=name)
+            self._emit(('task', kwargs))
+            return True
+
+    def queueConfirmationEmail(self, email, conf, transactional=False):
+        """Record a creation confirmation email."""
+        with self._lock:
+            if transactional and self._txn is None:
+                raise datastore_errors.BadRequestError(
+                    'Transactional tasks can only be added in a '
+                    'transaction.')
+            self._emit(('email', email, conf))
+
+    def startFanout(self, conf, changes):
+        """Record a notification fan-out; must run inside the
+        transaction updating conf."""
+        with self._lock:
+            if self._txn is None:
+                raise datastore_errors.BadRequestError(
+                    'Fan-outs can only be started in a transaction.')
+            self._emit(('fanout', conf.key, changes))
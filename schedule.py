@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""
+schedule.py -- Udacity conference server-side Python App Engine
+    session time intervals & overlap detection
+"""
+
+import datetime
+import heapq
+
+
+def sessionInterval(sess):
+    """Return (start, end) datetimes of a Session, or None if its date or
+    startTime is unknown. duration is stored as a time of day (HH:MM)."""
+    if not sess.date or not sess.startTime:
+        return None
+    start = datetime.datetime.combine(sess.date, sess.startTime)
+    length = datetime.timedelta()
+    if sess.duration:
+        length = datetime.timedelta(hours=sess.duration.hour,
+                                    minutes=sess.duration.minute)
+    return start, start + length
+
+
+def findOverlaps(intervals):
+    """Return (a, b) item pairs whose [start, end) intervals overlap.
+
+    intervals is a list of (start, end, item). Sorting plus a heap of the
+    intervals still open makes this O(n log n + k) for k overlaps.
+    """
+    overlaps = []
+    active = []  # heap of (end, index, item)
+    for index, (start, end, item) in enumerate(
+            sorted(intervals, key=lambda interval: interval[:2])):
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for _, _, other in active:
+            overlaps.append((other, item))
+        heapq.heappush(active, (end, index, item))
+    return overlaps
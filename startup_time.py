@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+startup_time.py -- Udacity conference server-side Python App Engine
+    measure what a new instance pays before serving its first request
+
+Imports the app's entry points in a fresh interpreter per run (as a new
+instance would), timing each step, then reports min/median/max over the
+runs:
+
+    python startup_time.py --sdk ~/google-cloud-sdk/platform/google_appengine
+
+Steps are cumulative: a module's time includes whatever it imports that
+was not loaded yet. 'deferred' imports the modules the app only loads on
+first use (or during warmup), to show what deferring them saves.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# (step, modules imported by it), in the order an instance loads them
+STEPS = (
+    ('models', ('models',)),
+    ('conference', ('conference',)),
+    ('main', ('main',)),
+    ('deferred', ('google.appengine.api.app_identity',
+                  'google.appengine.api.mail',
+                  'google.appengine.api.urlfetch')),
+)
+
+
+def _setupPath(sdk):
+    """Put the App Engine SDK & its bundled libraries on sys.path."""
+    if sdk:
+        sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('APPLICATION_ID', 'dev~startup-time')
+
+
+def _measure(sdk):
+    """Time each step once; return {step: seconds}."""
+    _setupPath(sdk)
+    timings = {}
+    for step, modules in STEPS:
+        started = time.time()
+        for module in modules:
+            __import__(module)
+        timings[step] = time.time() - started
+    return timings
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sdk', help='App Engine SDK directory '
+                        '(the one containing dev_appserver.py)')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='fresh interpreters to measure (default 10)')
+    parser.add_argument('--child', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print json.dumps(_measure(args.sdk))
+        return
+
+    command = [sys.executable, os.path.abspath(__file__), '--child']
+    if args.sdk:
+        command += ['--sdk', args.sdk]
+    runs = [json.loads(subprocess.check_output(command).splitlines()[-1])
+            for _ in xrange(args.runs)]
+
+    print '%-12s %9s %9s %9s' % ('step', 'min ms', 'median ms', 'max ms')
+    for step, _ in STEPS + (('total', ()),):
+        if step == 'total':
+            values = [sum(run.values()) for run in runs]
+        else:
+            values = [run[step] for run in runs]
+        print '%-12s %9.1f %9.1f %9.1f' % (
+            step, min(values) * 1000, _median(values) * 1000,
+            max(values) * 1000)
+
+
+if __name__ == '__main__':
+    main()
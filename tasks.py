@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""
+tasks.py -- Udacity conference server-side Python App Engine
+    idempotent task queue helpers
+
+Producers whose work has a stable identity (a job's batch, a cache
+key's expiry, a conference's speaker) name their tasks after it, so
+enqueueing it again is dropped by the queue. Tasks following a write
+(e.g. indexing a new entity) are instead added transactionally with it:
+they cannot be named, but are enqueued if and only if the write commits.
+
+Handlers decorated with @idempotent claim the task name in a
+transaction before running, for TASK_CLAIM_LEASE, and mark it done once
+the handler succeeded, so a redelivered task is not run twice. A failed
+run drops its claim; a run that dies without doing so (deadline, lost
+instance) is retried once its lease expired. Records older than
+PROCESSED_TASK_TTL (longer than a task is retried or its name
+tombstoned) are purged by cron.
+"""
+
+import datetime
+import hashlib
+import logging
+import re
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import ProcessedTask
+
+TASK_NAME_MAX = 500
+# longer than a push task may run
+TASK_CLAIM_LEASE = datetime.timedelta(minutes=15)
+PROCESSED_TASK_TTL = datetime.timedelta(days=14)
+PURGE_BATCH_SIZE = 500
+PURGE_TIME_BUDGET = 45
+_TASK_NAME_INVALID = re.compile(r'[^a-zA-Z0-9_-]')
+
+
+def taskName(operation, *parts):
+    """Return a deterministic, valid task name for operation on parts."""
+    name = '-'.join((operation,) + tuple(str(part) for part in parts))
+    name = _TASK_NAME_INVALID.sub('_', name)
+    if len(name) > TASK_NAME_MAX:
+        name = '%s-%s' % (operation, hashlib.sha1(name).hexdigest())
+    return name
+
+
+def addTask(url, params=None, name=None, transactional=False,
+            **kwargs):
+    """Add a push task; return False if a task of that name already
+    exists (or existed recently)."""
+    try:
+        taskqueue.add(url=url, params=params, name=name,
+                      transactional=transactional, **kwargs)
+    except (taskqueue.TaskAlreadyExistsError,
+            taskqueue.TombstonedTaskError):
+        logging.info('Task %s already enqueued; skipping.', name)
+        return False
+    return True
+
+
+@ndb.transactional
+def _claimTask(name):
+    """Claim task name for this run; return the ProcessedTask record
+    that prevents it (done, or claimed by a run still leased), or
+    None if claimed."""
+    now = datetime.datetime.utcnow()
+    record = ProcessedTask.get_by_id(name)
+    if record and (record.done or record.leaseExpires > now):
+        return record
+    ProcessedTask(id=name, done=False,
+                  leaseExpires=now + TASK_CLAIM_LEASE).put()
+    return None
+
+
+def idempotent(post):
+    """Decorate a task handler's post() so each task name runs once."""
+    def wrapper(self, *args, **kwargs):
+        name = self.request.headers.get('X-AppEngine-TaskName')
+        if not name:
+            return post(self, *args, **kwargs)
+        record = _claimTask(name)
+        if record and record.done:
+            logging.info('Task %s already processed; skipping.', name)
+            return
+        if record:
+            # another run holds it; retry once it finished or its lease
+            # expired
+            logging.info('Task %s is being processed; retrying.', name)
+            self.response.set_status(409)
+            return
+        done = False
+        try:
+            post(self, *args, **kwargs)
+            done = self.response.status_int < 300
+        finally:
+            if done:
+                ProcessedTask(id=name, done=True).put()
+            else:
+                ndb.Key(ProcessedTask, name).delete()
+    return wrapper
+
+
+def purgeProcessedTasks():
+    """Delete expired ProcessedTask records in batches, for at most
+    PURGE_TIME_BUDGET seconds; return how many were deleted."""
+    cutoff = datetime.datetime.utcnow() - PROCESSED_TASK_TTL
+    q = ProcessedTask.query(ProcessedTask.created < cutoff)
+    started = time.time()
+    deleted = 0
+    while time.time() - started < PURGE_TIME_BUDGET:
+        keys = q.fetch(PURGE_BATCH_SIZE, keys_only=True)
+        ndb.delete_multi(keys)
+        deleted += len(keys)
+        if len(keys) < PURGE_BATCH_SIZE:
+            break
+    return deleted
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+textsearch.py -- Udacity conference server-side Python App Engine
+    full-text search over conferences and sessions using the Search API
+
+Documents are keyed by the websafe key of their entity, so (re)indexing
+is idempotent and search results resolve with a single ndb.get_multi.
+"""
+
+from google.appengine.api import search
+from google.appengine.ext import ndb
+
+CONFERENCE_INDEX = 'conferences'
+SESSION_INDEX = 'sessions'
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+def _conferenceFields(conf):
+    return [
+        search.TextField(name='name', value=conf.name),
+        search.TextField(name='description', value=conf.description),
+        search.TextField(name='topics', value=' '.join(conf.topics)),
+        search.TextField(name='city', value=conf.city),
+    ]
+
+
+def _sessionFields(sess):
+    return [
+        search.TextField(name='name', value=sess.name),
+        search.TextField(name='highlights', value=sess.highlights),
+        search.TextField(name='speaker', value=sess.speaker),
+        search.TextField(name='typeOfSession',
+                         value=' '.join(sess.typeOfSession)),
+    ]
+
+
+SEARCH_KINDS = {
+    'Conference': (CONFERENCE_INDEX, _conferenceFields),
+    'Session': (SESSION_INDEX, _sessionFields),
+}
+
+
+def indexEntity(websafeKey):
+    """(Re)index the Conference or Session behind websafeKey, removing
+    its document if the entity no longer exists."""
+    key = ndb.Key(urlsafe=websafeKey)
+    index_name, to_fields = SEARCH_KINDS[key.kind()]
+    index = search.Index(name=index_name)
+
+    entity = key.get()
+    if entity is None:
+        index.delete(websafeKey)
+    else:
+        index.put(search.Document(doc_id=websafeKey,
+                                  fields=to_fields(entity)))
+
+
+def searchKeys(index_name, query_string, limit=None, pageToken=None):
+    """Run a ranked query; return (entity keys, next page token or None).
+
+    Raises search.QueryError for malformed queries and ValueError for a
+    bad pageToken.
+    """
+    limit = min(limit or SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    options = search.QueryOptions(
+        limit=limit,
+        ids_only=True,
+        cursor=search.Cursor(web_safe_string=pageToken),
+        sort_options=search.SortOptions(
+            match_scorer=search.MatchScorer(),
+            expressions=[search.SortExpression(
+                expression='_score',
+                direction=search.SortExpression.DESCENDING,
+                default_value=0)]))
+
+    results = search.Index(name=index_name).search(
+        search.Query(query_string=query_string, options=options))
+
+    keys = [ndb.Key(urlsafe=doc.doc_id) for doc in results.results]
+    token = results.cursor.web_safe_string if results.cursor else None
+    return keys, token
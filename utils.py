@@ -3,7 +3,6 @@ import os
 import time
 import uuid
 
-from google.appengine.api import urlfetch
 from models import Profile
 
 def getUserId(user, id_type="email"):
@@ -12,6 +11,9 @@ def getUserId(user, id_type="email"):
 
     if id_type == "oauth":
         """A workaround implementation for getting userid."""
+        # imported on first use; most instances never need it
+        from google.appengine.api import urlfetch
+
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
         token_type = 'id_token'